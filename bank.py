@@ -5,10 +5,38 @@ JSON-backed balance store for your Discord currency bot.
 Key features
 ------------
 - Thread-safe, atomic writes
+- Append-only write-ahead log: each mutation appends one line to balances.log;
+  the full balances.json snapshot is rewritten only every CHECKPOINT_EVERY
+  mutations (by a background thread) and at shutdown
 - Per-character balances via an optional `key` (e.g., "user_id:character_key")
+  (character keys are trimmed and lowercased)
 - Safe helpers for adding, subtracting, transferring, and listing balances
+- batch_update() to apply many mutations under one lock and one log flush
 - Leaderboards for users (total across characters) and for individual characters
 
+Durability
+----------
+Balances live in memory. Every mutation is appended to balances.log as
+{"k": key, "v": new_knuts} (v=null deletes the key) and flushed to the OS, so a
+process crash loses nothing; on import the snapshot is loaded and the log is
+replayed on top of it. Records hold absolute values, so replaying a log that
+was already folded into the snapshot is harmless. Normal interpreter exit and
+SIGTERM checkpoint via atexit once start() has run (the application installs
+the SIGTERM handler that turns it into a normal exit).
+
+Nothing is fsynced by default: the log and the snapshot survive a process
+crash but not necessarily a power loss or kernel panic. Set BANK_FSYNC=1 to
+fsync the snapshot at each checkpoint (so at most once per flush, never per
+mutation).
+
+Earnings credited with add_balance(defer_log=True) are the exception: they are
+applied in memory at once, but each wallet's new value is logged at most once
+per LOG_COALESCE_SECONDS, so a hard crash can lose that last window of them.
+
+Edit balances.json by hand only while the bot is stopped: outside edits are
+picked up on read only when the log is empty, and the next checkpoint
+overwrites them otherwise.
+
 Storage format
 --------------
 balances.json is a flat dict:
@@ -17,17 +45,33 @@ balances.json is a flat dict:
   "123456789012345678:dominic sullivan": 90, # per-character wallet (knuts)
   "234567890123456789:amelia bones": 493
 }
+In memory the same data is held as {user_id: {character_key | None: knuts}};
+the flat form is produced only when the snapshot is written.
 """
 
 from __future__ import annotations
+import atexit
+import heapq
 import json
 import os
+import shutil
+import sys
 import threading
-import tempfile
-from typing import Dict, List, Tuple, Optional
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import lru_cache
+from operator import itemgetter
+from typing import Dict, Iterable, List, Tuple, Optional
 from currency import Money
+from storage import file_sig
 import logging
 
+try:
+    import orjson  # optional: much faster encode/decode than stdlib json
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+
 # Child logger (parent configured in bot.py)
 logger = logging.getLogger("gringotts.bank")
 
@@ -35,126 +79,572 @@ logger = logging.getLogger("gringotts.bank")
 DATA_DIR = os.getenv("DATA_DIR", os.path.dirname(os.path.abspath(__file__)))
 os.makedirs(DATA_DIR, exist_ok=True)
 DB_FILE = os.path.join(DATA_DIR, "balances.json")
+WAL_FILE = os.path.join(DATA_DIR, "balances.log")
+# The log being folded into a snapshot; kept until that snapshot is on disk
+WAL_OLD_FILE = WAL_FILE + ".old"
+TMP_FILE = DB_FILE + ".tmp"
+
+# Set BANK_PRETTY=1 to write indented JSON (easier for humans, ~2x bytes)
+BANK_PRETTY = os.getenv("BANK_PRETTY", "0") == "1"
+# Set BANK_FSYNC=1 to fsync each snapshot before it replaces balances.json
+BANK_FSYNC = os.getenv("BANK_FSYNC", "0") == "1"
+
+class _RWLock:
+    """
+    Many concurrent readers or one exclusive writer.
+    Waiting writers block new readers so a steady read load can't starve them.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
 
-_lock = threading.Lock()
+
+_lock = _RWLock()
+
+# Rewrite the balances.json snapshot (and retire the log) after this many
+# logged mutations. The flusher waits FLUSH_DELAY_SECONDS once signalled.
+CHECKPOINT_EVERY = int(os.getenv("BANK_CHECKPOINT_EVERY", "1000"))
+FLUSH_DELAY_SECONDS = 0.2
+_dirty = threading.Event()
+
+# Deferred updates (add_balance(defer_log=True)) change _state immediately but
+# log each touched wallet's value once per LOG_COALESCE_SECONDS window.
+LOG_COALESCE_SECONDS = 2.0
+_unlogged: set = set()  # {(user_id, character_key)}
+_log_pending = threading.Event()
 
 # ---------------- Internal I/O ----------------
-def _load() -> Dict[str, int]:
+def _split_key(k: str) -> Tuple[int, Optional[str]]:
+    """Parse a flat storage key ("123" or "123:amelia") into (user_id, character_key)."""
+    uid_str, sep, char_key = k.partition(":")
+    return int(uid_str), (char_key if sep else None)
+
+
+@lru_cache(maxsize=8192)
+def _flat_key(user_id: int, char_key: Optional[str]) -> str:
+    """
+    Inverse of _split_key: the flat string form used on disk and in the log.
+    Cached since every mutation and most log lines rebuild the same few keys.
+    """
+    if char_key is None:
+        return f"{user_id}"
+    return f"{user_id}:{char_key}"
+
+
+def _load_from_disk() -> Dict[int, Dict[Optional[str], int]]:
     if not os.path.exists(DB_FILE):
         if logger.isEnabledFor(logging.DEBUG):
-            logger.debug(f"load:missing_file path='{DB_FILE}' -> {{}}")
+            logger.debug("load:missing_file path='%s' -> {}", DB_FILE)
         return {}
     try:
-        with open(DB_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except json.JSONDecodeError as e:
-        logger.exception(f"load:json_decode_error file='{DB_FILE}': {e}")
+        if orjson is not None:
+            with open(DB_FILE, "rb") as f:
+                data = orjson.loads(f.read())
+        else:
+            with open(DB_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+    except json.JSONDecodeError as e:  # orjson.JSONDecodeError subclasses this
+        logger.exception("load:json_decode_error file='%s': %s", DB_FILE, e)
         return {}
     except Exception as e:
-        logger.exception(f"load:error file='{DB_FILE}': {e}")
+        logger.exception("load:error file='%s': %s", DB_FILE, e)
         return {}
 
-    # Ensure canonical types
-    out: Dict[str, int] = {}
-    bad = 0
+    # Unflatten into {user_id: {character_key | None: knuts}}. JSON object keys
+    # are always str, and values we wrote ourselves are already int, so int()
+    # only runs for hand-edited entries (e.g. "150" or 150.0).
+    out: Dict[int, Dict[Optional[str], int]] = {}
+    count = bad = 0
     for k, v in data.items():
         try:
-            out[str(k)] = int(v)
+            uid, char_key = _split_key(k)
+            if char_key is not None:
+                char_key = sys.intern(char_key)
+            if type(v) is not int:
+                v = int(v)
+            out.setdefault(uid, {})[char_key] = v
+            count += 1
         except Exception:
+            logger.warning("load:bad_entry key='%s' (skipped)", k)
             bad += 1
     if logger.isEnabledFor(logging.DEBUG):
-        logger.debug(f"load:ok count={len(out)} bad={bad}")
+        logger.debug("load:ok count=%s bad=%s", count, bad)
     return out
 
 
-def _atomic_write(data: Dict[str, int]) -> None:
-    """Write JSON atomically to avoid partial/corrupt files."""
-    dir_ = os.path.dirname(DB_FILE) or "."
+def _flatten(state: Dict[int, Dict[Optional[str], int]]) -> Dict[str, int]:
+    """Serialize shim: nested resident state -> legacy flat on-disk dict."""
+    return {
+        _flat_key(uid, char_key): v
+        for uid, wallets in state.items()
+        for char_key, v in wallets.items()
+    }
+
+
+def _loads(raw: bytes):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _dumps_line(rec: dict) -> bytes:
+    """Compact single-line encoding for log records (ignores BANK_PRETTY)."""
+    if orjson is not None:
+        return orjson.dumps(rec) + b"\n"
+    return json.dumps(rec, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def _dumps(data: Dict[str, int]) -> bytes:
+    """Encode the whole document up front so it can be written in one call."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if BANK_PRETTY else 0)
+    if BANK_PRETTY:
+        return json.dumps(data, indent=2).encode("utf-8")
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def _write_all(fd: int, payload: bytes) -> None:
+    view = memoryview(payload)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _atomic_write(data: Dict[str, int]) -> bool:
+    """Write JSON atomically to avoid partial/corrupt files. Returns True on success."""
+    # Fixed sibling temp path: saves only happen under _checkpoint_lock, so no
+    # unique name is needed, and os.replace keeps the swap atomic.
+    tmp_path = TMP_FILE
     try:
-        with tempfile.NamedTemporaryFile("w", delete=False, dir=dir_, encoding="utf-8") as tmp:
-            json.dump(data, tmp, indent=2)
-            tmp_path = tmp.name
+        payload = _dumps(data)
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            _write_all(fd, payload)
+            if BANK_FSYNC:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
         os.replace(tmp_path, DB_FILE)
         if logger.isEnabledFor(logging.DEBUG):
-            logger.debug(f"save:ok path='{DB_FILE}' count={len(data)}")
+            logger.debug("save:ok path='%s' count=%s", DB_FILE, len(data))
+        return True
     except Exception as e:
-        logger.exception(f"save:error path='{DB_FILE}': {e}")
+        logger.exception("save:error path='%s': %s", DB_FILE, e)
         try:
-            if "tmp_path" in locals() and os.path.exists(tmp_path):
+            if os.path.exists(tmp_path):
                 os.remove(tmp_path)
         except Exception:
             pass
+        return False
+
+
+# ---------------- Write-ahead log ----------------
+def _apply(state: Dict[int, Dict[Optional[str], int]], uid: int, char_key: Optional[str], v: Optional[int]) -> int:
+    """Set (or delete, v=None) one wallet in `state`. Returns the knuts it held before."""
+    wallets = state.get(uid)
+    if v is None:
+        if wallets is None:
+            return 0
+        old = wallets.pop(char_key, 0)
+        if not wallets:
+            del state[uid]
+        return old
+    if wallets is None:
+        wallets = state[uid] = {}
+    old = wallets.get(char_key, 0)
+    wallets[char_key] = v
+    return old
+
+
+def _replay_file(state: Dict[int, Dict[Optional[str], int]], path: str) -> int:
+    """Apply one log file on top of `state`. Returns records applied."""
+    if not os.path.exists(path):
+        return 0
+    applied = 0
+    try:
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    rec = _loads(line)
+                    uid, char_key = _split_key(str(rec["k"]))
+                    if char_key is not None:
+                        char_key = sys.intern(char_key)
+                    v = rec.get("v")
+                    _apply(state, uid, char_key, None if v is None else int(v))
+                except Exception:
+                    # Typically a torn final line from a crash mid-append
+                    logger.warning("wal:bad_record line=%r (skipped)", line[:80])
+                    continue
+                applied += 1
+    except Exception as e:
+        logger.exception("wal:replay_error file='%s': %s", path, e)
+    if applied:
+        logger.info("wal:replayed records=%s file='%s'", applied, path)
+    return applied
+
+
+def _replay_wal(state: Dict[int, Dict[Optional[str], int]]) -> int:
+    """
+    Apply the logs on top of a freshly loaded snapshot, oldest first: a rotated-out
+    log whose checkpoint never landed, then the live one. Returns records applied.
+    """
+    return _replay_file(state, WAL_OLD_FILE) + _replay_file(state, WAL_FILE)
+
+
+# ---------------- Resident state ----------------
+# Authoritative in-memory balances: the snapshot plus any logged mutations,
+# keyed by user id then character key (None = the user-level wallet):
+#   _state[user_id][character_key | None] -> knuts
+# _state_sig remembers the snapshot signature we last read/wrote so outside
+# edits are still picked up while the log is empty.
+_state: Dict[int, Dict[Optional[str], int]] = _load_from_disk()
+_wal_ops = _replay_wal(_state)
+_state_sig: Optional[Tuple[int, int]] = file_sig(DB_FILE)
+_wal_fh = open(WAL_FILE, "ab")
+
+# Running sum across each user's wallets, kept in step by _record
+_user_total: Dict[int, int] = defaultdict(int)
+
+
+def _rebuild_totals() -> None:
+    _user_total.clear()
+    for uid, wallets in _state.items():
+        _user_total[uid] = sum(wallets.values())
+
+
+_rebuild_totals()
+
+
+def _sync() -> None:
+    """Reload _state if DB_FILE was changed by someone else. Call with the write lock held."""
+    global _state, _state_sig
+    if _wal_ops or _unlogged:
+        # Logged changes not yet in the snapshot win; the checkpoint overwrites the edit.
+        return
+    sig = file_sig(DB_FILE)
+    if sig != _state_sig:
+        logger.info("load:external_change path='%s' -> reloading", DB_FILE)
+        _state = _load_from_disk()
+        _state_sig = sig
+        _rebuild_totals()
+
+
+@contextmanager
+def _reading():
+    """Shared read access to _state, after picking up any outside edit to DB_FILE."""
+    if not _wal_ops and not _unlogged and file_sig(DB_FILE) != _state_sig:
+        with _lock.write():
+            _sync()
+    with _lock.read():
+        yield
+
+
+def _record(
+    uid: int, char_key: Optional[str], v: Optional[int], flush: bool = True, log: bool = True
+) -> None:
+    """
+    Apply one mutation to _state and append it to the log. Call with the write lock held.
+    Pass flush=False when recording several changes; then call _wal_flush() once at the end.
+    Pass log=False to coalesce: the wallet's value is logged later by _write_unlogged().
+    """
+    # _state holds plain ints only; values are coerced once, at the JSON boundary
+    assert v is None or type(v) is int, v
+    old = _apply(_state, uid, char_key, v)
+    if uid in _state:
+        _user_total[uid] += (v or 0) - old
+    else:
+        _user_total.pop(uid, None)
+    if not log:
+        _unlogged.add((uid, char_key))
+        _log_pending.set()
+        return
+    _append(uid, char_key, v, flush)
+
+
+def _append(uid: int, char_key: Optional[str], v: Optional[int], flush: bool) -> None:
+    """Append one {"k","v"} record to the log. Call with the write lock held."""
+    global _wal_ops
+    try:
+        _wal_fh.write(_dumps_line({"k": _flat_key(uid, char_key), "v": v}))
+        if flush:
+            _wal_fh.flush()
+    except Exception as e:
+        logger.exception("wal:append_error file='%s' key='%s': %s", WAL_FILE, _flat_key(uid, char_key), e)
+        # Can't trust the log any more; get a snapshot out promptly
+        _dirty.set()
+    _wal_ops += 1
+    if _wal_ops >= CHECKPOINT_EVERY:
+        _dirty.set()
+
+
+def _wal_flush() -> None:
+    """Push buffered log records to the OS. Call with the write lock held."""
+    try:
+        _wal_fh.flush()
+    except Exception as e:
+        logger.exception("wal:flush_error file='%s': %s", WAL_FILE, e)
+        _dirty.set()
+
+
+def _write_unlogged() -> None:
+    """Log the current value of every wallet changed with log=False. Call with the write lock held."""
+    _log_pending.clear()
+    if not _unlogged:
+        return
+    for uid, char_key in _unlogged:
+        _append(uid, char_key, _state.get(uid, {}).get(char_key), flush=False)
+    _unlogged.clear()
+    _wal_flush()
+
+
+# Serializes checkpoints (flusher thread vs. exit). Taken before _lock, never inside it.
+_checkpoint_lock = threading.Lock()
+
+
+def _rotate_wal() -> None:
+    """
+    Move the live log aside to WAL_OLD_FILE and start a fresh one. Call with the
+    write lock held. If WAL_OLD_FILE is still there (its checkpoint failed), the
+    live records are appended to it instead, so replay order stays oldest-first.
+    """
+    global _wal_fh
+    _wal_fh.close()
+    try:
+        if os.path.exists(WAL_OLD_FILE):
+            with open(WAL_FILE, "rb") as src, open(WAL_OLD_FILE, "ab") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(WAL_FILE)
+        else:
+            os.replace(WAL_FILE, WAL_OLD_FILE)
+    finally:
+        _wal_fh = open(WAL_FILE, "ab")
+
+
+def _checkpoint() -> None:
+    """
+    Write the snapshot and retire the log. Call with _checkpoint_lock held (not _lock).
+    Only the in-memory flatten and the log rotation happen under the write lock;
+    encoding and writing the snapshot don't block balance updates.
+    """
+    global _wal_ops, _state_sig
+    with _lock.write():
+        _write_unlogged()
+        _dirty.clear()
+        if not _wal_ops:
+            return
+        try:
+            _rotate_wal()
+        except Exception as e:
+            logger.exception("wal:rotate_error file='%s': %s", WAL_FILE, e)
+            _dirty.set()
+            return
+        snapshot = _flatten(_state)
+        ops = _wal_ops
+        _wal_ops = 0
+
+    if not _atomic_write(snapshot):
+        with _lock.write():
+            # Keep WAL_OLD_FILE and retry on the next pass; until then the
+            # snapshot on disk is stale, so outside edits must not be loaded.
+            _wal_ops += ops
+        _dirty.set()
+        return
+    sig = file_sig(DB_FILE)
+    try:
+        os.remove(WAL_OLD_FILE)
+    except Exception as e:
+        # Harmless: records are absolute values, so replaying them is idempotent
+        logger.exception("wal:remove_error file='%s': %s", WAL_OLD_FILE, e)
+    with _lock.write():
+        _state_sig = sig
+
+
+def _flush_now() -> None:
+    """Checkpoint synchronously (used by the flusher and at exit)."""
+    with _checkpoint_lock:
+        _checkpoint()
+
+
+def _flusher() -> None:
+    while True:
+        _dirty.wait()
+        time.sleep(FLUSH_DELAY_SECONDS)
+        _flush_now()
 
 
-def _save(data: Dict[str, int]) -> None:
-    _atomic_write(data)
+def _coalescer() -> None:
+    while True:
+        _log_pending.wait()
+        time.sleep(LOG_COALESCE_SECONDS)
+        with _lock.write():
+            _write_unlogged()
 
 
-def _k(user_id: int, key: Optional[str]) -> str:
-    """Build the storage key. When `key` is None, it's a user-level wallet."""
+_started = False
+
+
+def start() -> None:
+    """
+    Start background checkpointing for a long-running process (the bot calls this
+    at startup): fold any log left by the last run into a fresh snapshot, start the
+    flusher and coalescer threads, and checkpoint again at interpreter exit.
+    Importing the module does none of this; without start(), mutations are still
+    logged but the log is only folded in by shutdown() or the next start().
+    Idempotent.
+    """
+    global _started
+    if _started:
+        return
+    _started = True
+    if _wal_ops:
+        _flush_now()
+    threading.Thread(target=_flusher, name="bank-flusher", daemon=True).start()
+    threading.Thread(target=_coalescer, name="bank-log-coalescer", daemon=True).start()
+    atexit.register(shutdown)
+
+
+def shutdown() -> None:
+    """Final checkpoint: log any coalesced updates and write the snapshot. Safe to call more than once."""
+    _flush_now()
+
+
+def _ck(key: Optional[str]) -> Optional[str]:
+    """Internal character key: trimmed, lowercased and interned (cheap dict lookups); None for the user-level wallet."""
     if not key:
-        return f"{user_id}"
-    return f"{user_id}:{key.strip().lower()}"
+        return None
+    return sys.intern(key.strip().lower())
 
 # ---------------- Core API (user/character) ----------------
 def get_balance(user_id: int, key: Optional[str] = None) -> Money:
     """Return the balance for (user[, character key]) as Money."""
-    kk = _k(user_id, key)
-    with _lock:
-        data = _load()
-        v = int(data.get(kk, 0))
+    ck = _ck(key)
+    with _reading():
+        v = _state.get(user_id, {}).get(ck, 0)
     if logger.isEnabledFor(logging.DEBUG):
-        logger.debug(f"get_balance key='{kk}' knuts={v}")
+        logger.debug("get_balance key='%s' knuts=%s", _flat_key(user_id, ck), v)
     return Money(knuts=v)
 
 
+def get_balances(user_id: int, keys: Iterable[Optional[str]]) -> Dict[Optional[str], Money]:
+    """Return {key: Money} for several of one user's wallets under a single read."""
+    keys = list(keys)
+    with _reading():
+        wallets = _state.get(user_id, {})
+        vals = [wallets.get(_ck(key), 0) for key in keys]
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("get_balances user_id=%s count=%s", user_id, len(keys))
+    return {key: Money(knuts=v) for key, v in zip(keys, vals)}
+
+
 def set_balance(user_id: int, amount: Money, key: Optional[str] = None) -> None:
     """Set the balance to an exact amount (overwrites)."""
-    kk = _k(user_id, key)
-    with _lock:
-        data = _load()
-        data[kk] = int(amount.knuts)
-        _save(data)
-    logger.info(f"set_balance key='{kk}' knuts={int(amount.knuts)}")
+    ck = _ck(key)
+    newv = amount.knuts
+    with _lock.write():
+        _sync()
+        changed = _state.get(user_id, {}).get(ck) != newv
+        if changed:
+            _record(user_id, ck, newv)
+    if not changed:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("set_balance:noop key='%s' knuts=%s", _flat_key(user_id, ck), newv)
+        return
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("set_balance key='%s' knuts=%s", _flat_key(user_id, ck), newv)
 
 
-def add_balance(user_id: int, amount: Money, key: Optional[str] = None) -> None:
-    """Add (or subtract if negative) to the balance."""
+def add_balance(
+    user_id: int, amount: Money, key: Optional[str] = None, *, defer_log: bool = False
+) -> Money:
+    """
+    Add (or subtract if negative) to the balance. Returns the new balance.
+    defer_log=True coalesces the log record with other deferred updates to the same
+    wallet (see LOG_COALESCE_SECONDS); meant for high-rate, low-value credits.
+    """
     if amount.knuts == 0:
         if logger.isEnabledFor(logging.DEBUG):
-            logger.debug(f"add_balance:noop zero_amount user_id={user_id} key='{key}'")
-        return
-    kk = _k(user_id, key)
-    with _lock:
-        data = _load()
-        cur = int(data.get(kk, 0))
-        data[kk] = cur + int(amount.knuts)
-        _save(data)
-    logger.info(
-        f"add_balance key='{kk}' delta_knuts={int(amount.knuts)} new_knuts={cur + int(amount.knuts)} prev_knuts={cur}"
-    )
+            logger.debug("add_balance:noop zero_amount user_id=%s key='%s'", user_id, key)
+        return get_balance(user_id, key)
+    ck = _ck(key)
+    delta = amount.knuts
+    with _lock.write():
+        _sync()
+        cur = _state.get(user_id, {}).get(ck, 0)
+        newv = cur + delta
+        _record(user_id, ck, newv, log=not defer_log)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "add_balance key='%s' delta_knuts=%s new_knuts=%s prev_knuts=%s",
+            _flat_key(user_id, ck), delta, newv, cur
+        )
+    return Money(knuts=newv)
 
 
 def subtract_if_enough(user_id: int, price: Money, key: Optional[str] = None) -> bool:
     """Subtract `price` iff there is enough balance. Returns True on success."""
-    need = int(price.knuts)
+    return try_subtract(user_id, price, key)[0]
+
+
+def try_subtract(user_id: int, price: Money, key: Optional[str] = None) -> Tuple[bool, Money]:
+    """
+    Like subtract_if_enough, but always reports a balance: (True, new_balance) on
+    success, (False, current_balance) when funds are insufficient. Saves callers a
+    get_balance() re-read for the "you only have X" reply.
+    """
+    need = price.knuts
     if need <= 0:
         if logger.isEnabledFor(logging.DEBUG):
-            logger.debug(f"subtract:trivial need={need} user_id={user_id} key='{key}' -> True")
-        return True
-
-    kk = _k(user_id, key)
-    with _lock:
-        data = _load()
-        cur = int(data.get(kk, 0))
-        if cur < need:
-            logger.info(f"subtract:insufficient key='{kk}' need={need} have={cur} -> False")
-            return False
-        data[kk] = cur - need
-        _save(data)
-        newv = cur - need
-    logger.info(f"subtract:ok key='{kk}' need={need} new_knuts={newv} prev_knuts={cur}")
-    return True
+            logger.debug("subtract:trivial need=%s user_id=%s key='%s' -> True", need, user_id, key)
+        return True, get_balance(user_id, key)
+
+    ck = _ck(key)
+    with _lock.write():
+        _sync()
+        cur = _state.get(user_id, {}).get(ck, 0)
+        ok = cur >= need
+        if ok:
+            newv = cur - need
+            _record(user_id, ck, newv)
+    if not ok:
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("subtract:insufficient key='%s' need=%s have=%s -> False", _flat_key(user_id, ck), need, cur)
+        return False, Money(knuts=cur)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("subtract:ok key='%s' need=%s new_knuts=%s prev_knuts=%s", _flat_key(user_id, ck), need, newv, cur)
+    return True, Money(knuts=newv)
 
 
 def transfer(
@@ -169,48 +659,151 @@ def transfer(
     - from_key / to_key let you move between specific character wallets or user-level wallets.
     - Returns True if successful, False otherwise (insufficient funds or invalid amount).
     """
-    amt = int(amount.knuts)
-    if amt <= 0 or (sender_id == receiver_id and (from_key or "") == (to_key or "")):
+    return try_transfer(sender_id, receiver_id, amount, from_key, to_key)[0]
+
+
+def try_transfer(
+    sender_id: int,
+    receiver_id: int,
+    amount: Money,
+    from_key: Optional[str] = None,
+    to_key: Optional[str] = None,
+) -> Tuple[bool, Money, Money]:
+    """
+    Like transfer, but also reports the balances it saw: (ok, sender_balance,
+    receiver_balance), new values on success and unchanged ones on failure.
+    Saves callers the get_balance() re-reads for receipts or "you only have X" replies.
+    """
+    s_ck, r_ck = _ck(from_key), _ck(to_key)
+    amt = amount.knuts
+    with _lock.write():
+        _sync()
+        s_cur = _state.get(sender_id, {}).get(s_ck, 0)
+        r_cur = _state.get(receiver_id, {}).get(r_ck, 0)
+        if amt <= 0 or (sender_id == receiver_id and s_ck == r_ck):
+            entry = ("transfer:invalid", amt, sender_id, receiver_id, from_key, to_key)
+            ok = False
+        elif s_cur < amt:
+            entry = ("transfer:insufficient", sender_id, s_ck, s_cur, amt)
+            ok = False
+        else:
+            s_cur -= amt
+            r_cur += amt
+            _record(sender_id, s_ck, s_cur, flush=False)
+            _record(receiver_id, r_ck, r_cur, flush=False)
+            _wal_flush()
+            entry = ("transfer:ok", sender_id, s_ck, receiver_id, r_ck, amt, s_cur, r_cur)
+            ok = True
+    if logger.isEnabledFor(logging.INFO):
+        _log_batch_entry(entry)
+    return ok, Money(knuts=s_cur), Money(knuts=r_cur)
+
+
+# ---------------- Batched updates ----------------
+# Op name -> (min, max) positional args; omitted trailing keys default to None.
+_BATCH_ARITY = {"add": (2, 3), "set": (2, 3), "transfer": (3, 5)}
+
+
+def batch_update(ops: Iterable[Tuple[str, tuple]]) -> List[bool]:
+    """
+    Apply many mutations under a single lock acquisition and a single log flush.
+    Each op is one of:
+      ("add",      (user_id, amount, key))
+      ("set",      (user_id, amount, key))
+      ("transfer", (sender_id, receiver_id, amount, from_key, to_key))
+    Ops run in order and a failing transfer doesn't stop the rest.
+    Returns one bool per op (False for an invalid or unaffordable transfer).
+    """
+    batch = []
+    for op, args in ops:
+        lo, hi = _BATCH_ARITY.get(op, (0, -1))
+        if not lo <= len(args) <= hi:
+            raise ValueError(f"batch_update: bad op {op!r} args={args!r}")
+        batch.append((op, tuple(args) + (None,) * (hi - len(args))))
+
+    results: List[bool] = []
+    trail: List[tuple] = []  # what happened, for logging once the lock is released
+    with _lock.write():
+        _sync()
+        for op, args in batch:
+            if op == "add":
+                uid, amount, key = args
+                ck = _ck(key)
+                delta = amount.knuts
+                if delta:
+                    cur = _state.get(uid, {}).get(ck, 0)
+                    _record(uid, ck, cur + delta, flush=False)
+                    trail.append(("add", uid, ck, delta, cur + delta, cur))
+                results.append(True)
+            elif op == "set":
+                uid, amount, key = args
+                ck = _ck(key)
+                if _state.get(uid, {}).get(ck) != amount.knuts:
+                    _record(uid, ck, amount.knuts, flush=False)
+                    trail.append(("set", uid, ck, amount.knuts))
+                results.append(True)
+            else:
+                sid, rid, amount, from_key, to_key = args
+                s_ck, r_ck = _ck(from_key), _ck(to_key)
+                amt = amount.knuts
+                if amt <= 0 or (sid == rid and s_ck == r_ck):
+                    trail.append(("transfer:invalid", amt, sid, rid, from_key, to_key))
+                    results.append(False)
+                    continue
+                s_cur = _state.get(sid, {}).get(s_ck, 0)
+                if s_cur < amt:
+                    trail.append(("transfer:insufficient", sid, s_ck, s_cur, amt))
+                    results.append(False)
+                    continue
+                _record(sid, s_ck, s_cur - amt, flush=False)
+                r_new = _state.get(rid, {}).get(r_ck, 0) + amt
+                _record(rid, r_ck, r_new, flush=False)
+                trail.append(("transfer:ok", sid, s_ck, rid, r_ck, amt, s_cur - amt, r_new))
+                results.append(True)
+        if trail:
+            _wal_flush()
+
+    if logger.isEnabledFor(logging.INFO):
+        for t in trail:
+            _log_batch_entry(t)
+    if len(batch) > 1 and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("batch_update ops=%s ok=%s", len(batch), sum(results))
+    return results
+
+
+def _log_batch_entry(t: tuple) -> None:
+    kind = t[0]
+    if kind == "add":
+        _, uid, ck, delta, newv, cur = t
         logger.info(
-            f"transfer:invalid amt={amt} sender={sender_id} receiver={receiver_id} from='{from_key}' to='{to_key}'"
+            "add_balance key='%s' delta_knuts=%s new_knuts=%s prev_knuts=%s",
+            _flat_key(uid, ck), delta, newv, cur
+        )
+    elif kind == "set":
+        _, uid, ck, newv = t
+        logger.info("set_balance key='%s' knuts=%s", _flat_key(uid, ck), newv)
+    elif kind == "transfer:invalid":
+        _, amt, sid, rid, from_key, to_key = t
+        logger.info("transfer:invalid amt=%s sender=%s receiver=%s from='%s' to='%s'", amt, sid, rid, from_key, to_key)
+    elif kind == "transfer:insufficient":
+        _, sid, s_ck, s_cur, amt = t
+        logger.info("transfer:insufficient sender_key='%s' have=%s need=%s -> False", _flat_key(sid, s_ck), s_cur, amt)
+    else:
+        _, sid, s_ck, rid, r_ck, amt, s_new, r_new = t
+        logger.info(
+            "transfer:ok sender_key='%s' -> receiver_key='%s' amt=%s sender_new=%s receiver_new=%s",
+            _flat_key(sid, s_ck), _flat_key(rid, r_ck), amt, s_new, r_new
         )
-        return False
-
-    s_key = _k(sender_id, from_key)
-    r_key = _k(receiver_id, to_key)
-    with _lock:
-        data = _load()
-        s_cur = int(data.get(s_key, 0))
-        if s_cur < amt:
-            logger.info(
-                f"transfer:insufficient sender_key='{s_key}' have={s_cur} need={amt} -> False"
-            )
-            return False
-
-        data[s_key] = s_cur - amt
-        data[r_key] = int(data.get(r_key, 0)) + amt
-        _save(data)
-        r_new = int(data[r_key])
-    logger.info(
-        f"transfer:ok sender_key='{s_key}' -> receiver_key='{r_key}' amt={amt} "
-        f"sender_new={s_cur - amt} receiver_new={r_new}"
-    )
-    return True
 
 # ---------------- Introspection & Utilities ----------------
 def user_total(user_id: int) -> Money:
     """
     Sum all balances belonging to a user across user-level and all character keys.
     """
-    uid_prefix = f"{user_id}"
-    total = 0
-    with _lock:
-        data = _load()
-    for k, v in data.items():
-        if k == uid_prefix or k.startswith(uid_prefix + ":"):
-            total += int(v)
+    with _reading():
+        total = _user_total.get(user_id, 0)
     if logger.isEnabledFor(logging.DEBUG):
-        logger.debug(f"user_total user_id={user_id} knuts={total}")
+        logger.debug("user_total user_id=%s knuts=%s", user_id, total)
     return Money(knuts=total)
 
 
@@ -219,16 +812,14 @@ def character_balances(user_id: int) -> Dict[str, Money]:
     Return a dict of {character_key(lowercased): Money} for the given user.
     (Does not include the user-level wallet with no key.)
     """
-    uid_prefix = f"{user_id}:"
-    out: Dict[str, Money] = {}
-    with _lock:
-        data = _load()
-    for k, v in data.items():
-        if k.startswith(uid_prefix):
-            char_key = k[len(uid_prefix):]
-            out[char_key] = Money(knuts=int(v))
+    with _reading():
+        out = {
+            char_key: Money(knuts=v)
+            for char_key, v in _state.get(user_id, {}).items()
+            if char_key is not None
+        }
     if logger.isEnabledFor(logging.DEBUG):
-        logger.debug(f"character_balances user_id={user_id} count={len(out)}")
+        logger.debug("character_balances user_id=%s count=%s", user_id, len(out))
     return out
 
 
@@ -237,19 +828,29 @@ def rename_character_key(user_id: int, old_key: str, new_key: str) -> bool:
     Rename a character's key for a user.
     Returns True if successful (old existed and new did not).
     """
-    oldk = _k(user_id, old_key)
-    newk = _k(user_id, new_key)
-    with _lock:
-        data = _load()
-        if oldk not in data or newk in data:
+    old_ck = _ck(old_key)
+    new_ck = _ck(new_key)
+    with _lock.write():
+        _sync()
+        wallets = _state.get(user_id, {})
+        exists_old = old_ck in wallets
+        exists_new = new_ck in wallets
+        ok = exists_old and not exists_new
+        if ok:
+            _record(user_id, new_ck, wallets[old_ck])
+            _record(user_id, old_ck, None)
+    if not ok:
+        if logger.isEnabledFor(logging.INFO):
             logger.info(
-                f"rename_key:failed user_id={user_id} old='{oldk}' new='{newk}' "
-                f"exists_old={oldk in data} exists_new={newk in data}"
+                "rename_key:failed user_id=%s old='%s' new='%s' exists_old=%s exists_new=%s",
+                user_id, _flat_key(user_id, old_ck), _flat_key(user_id, new_ck), exists_old, exists_new
             )
-            return False
-        data[newk] = data.pop(oldk)
-        _save(data)
-    logger.info(f"rename_key:ok user_id={user_id} old='{oldk}' new='{newk}'")
+        return False
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "rename_key:ok user_id=%s old='%s' new='%s'",
+            user_id, _flat_key(user_id, old_ck), _flat_key(user_id, new_ck)
+        )
     return True
 
 # ---------------- Leaderboards ----------------
@@ -258,19 +859,11 @@ def top_users(n: int = 10) -> List[Tuple[int, Money]]:
     Top users by TOTAL balance across all their wallets.
     Returns a list of (user_id, Money).
     """
-    with _lock:
-        data = _load()
-
-    totals: Dict[int, int] = {}
-    for k, v in data.items():
-        uid_str = k.split(":", 1)[0]
-        uid = int(uid_str)
-        totals[uid] = totals.get(uid, 0) + int(v)
-
-    ranked = sorted(totals.items(), key=lambda kv: kv[1], reverse=True)
-    res = [(uid, Money(knuts=knuts)) for uid, knuts in ranked[:max(1, n)]]
+    with _reading():
+        ranked = heapq.nlargest(max(1, n), _user_total.items(), key=itemgetter(1))
+    res = [(uid, Money(knuts=knuts)) for uid, knuts in ranked]
     if logger.isEnabledFor(logging.DEBUG):
-        logger.debug(f"top_users n={n} returned={len(res)}")
+        logger.debug("top_users n=%s returned=%s", n, len(res))
     return res
 
 
@@ -279,15 +872,19 @@ def top_characters(n: int = 10) -> List[Tuple[int, str, Money]]:
     Top character wallets (not aggregated).
     Returns a list of (user_id, character_key, Money).
     """
-    out: List[Tuple[int, str, Money]] = []
-    with _lock:
-        data = _load()
-    for k, v in data.items():
-        if ":" in k:
-            uid_str, char_key = k.split(":", 1)
-            out.append((int(uid_str), char_key, Money(knuts=int(v))))
-    out.sort(key=lambda t: t[2].knuts, reverse=True)
-    res = out[:max(1, n)]
+    # Rank on raw knuts; only the rows that make the cut get wrapped in Money
+    with _reading():
+        top = heapq.nlargest(
+            max(1, n),
+            (
+                (uid, char_key, v)
+                for uid, wallets in _state.items()
+                for char_key, v in wallets.items()
+                if char_key is not None
+            ),
+            key=itemgetter(2),
+        )
+    res = [(uid, char_key, Money(knuts=v)) for uid, char_key, v in top]
     if logger.isEnabledFor(logging.DEBUG):
-        logger.debug(f"top_characters n={n} returned={len(res)}")
+        logger.debug("top_characters n=%s returned=%s", n, len(res))
     return res
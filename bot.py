@@ -1,55 +1,68 @@
 # bot.py
 import os
+import atexit
 from dotenv import load_dotenv
 from pathlib import Path
 load_dotenv(dotenv_path=Path(__file__).with_name(".env"), override=True)
 
 import time
+import asyncio
+import bisect
+import contextlib
+import gc
+import hashlib
+import itertools
 import discord
-import random
 import datetime
 import json
 import logging
 import logging.handlers
-from logging.handlers import RotatingFileHandler
-from typing import Tuple, Dict
+import queue
+import re
+import signal
+from collections import OrderedDict
+from typing import Iterable
+
+try:
+    import orjson  # optional: much faster encode/decode than stdlib json
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
 
 from discord import app_commands
 from discord.ext import commands, tasks
 
 from currency import Money
+from storage import file_sig
 from bank import (
-    get_balance, set_balance, add_balance, subtract_if_enough,
-    top_users, top_characters,
+    get_balance, get_balances, add_balance, try_subtract,
+    top_users, top_characters, batch_update, try_transfer,
+    start as start_bank,
 )
 from links import (
     link_character, unlink_character, resolve_character,
-    all_links, normalize_display_name,
+    normalize_display_name, resolve_with_key, chars_for_user,
+)
+from vaults import (
+    unlink_vault_thread, post_receipt,
+    get_vault_info, set_vault_info, generate_vault_number,
 )
-from vaults import set_vault_thread, get_vault_thread, unlink_vault_thread, post_receipt
-
-# ---------------- DATA DIR / FILES ----------------
-DATA_DIR = os.getenv("DATA_DIR", os.path.dirname(os.path.abspath(__file__)))
-os.makedirs(DATA_DIR, exist_ok=True)
 
-DB_FILE = os.path.join(DATA_DIR, "balances.json")
-PENDING_FILE = os.path.join(DATA_DIR, "pending_receipts.json")
+# ---------------- GC TUNING ----------------
+# The bot churns short-lived objects (events, embeds, tuples) but creates little
+# new long-lived state, so collect gen 0 far less often than the default 700.
+# Trade-off: somewhat higher peak RSS for fewer collector pauses on the event
+# loop. Startup state is also frozen after the first on_ready.
+gc.set_threshold(100_000, 20, 20)
 
 # ---------------- DATA DIR / FILES ----------------
+# Balances (balances.json) are owned by bank.py.
 DATA_DIR = os.getenv("DATA_DIR", os.path.dirname(os.path.abspath(__file__)))
 os.makedirs(DATA_DIR, exist_ok=True)
 
-# Remove DB_FILE if unused elsewhere
-# DB_FILE = os.path.join(DATA_DIR, "balances.json")
 PENDING_FILE = os.path.join(DATA_DIR, "pending_receipts.json")
-
-# NEW: simple shop storage
 SHOPS_FILE = os.path.join(DATA_DIR, "shops.json")
 
-
 # ---------------- LOGGING ----------------
-import logging, logging.handlers, os, re
-
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 LOG_FILE  = os.getenv("LOG_FILE", "bot.log")
 
@@ -66,6 +79,11 @@ class WebhookNoiseFilter(logging.Filter):
     SILENCE_WEBHOOK_NAMES: set[str] = set()
 
     def filter(self, record: logging.LogRecord) -> bool:
+        # Nothing configured (the usual case): pass through before any formatting or regex work
+        ids, names = self.SILENCE_WEBHOOK_IDS, self.SILENCE_WEBHOOK_NAMES
+        if not (ids or names):
+            return True
+
         # Only filter our app logger; never touch discord or root logs.
         if not record.name.startswith("gringotts"):
             return True
@@ -73,19 +91,20 @@ class WebhookNoiseFilter(logging.Filter):
         msg = record.getMessage()
 
         # Match an exact webhook id token
-        m = _WEBHOOK_ID_RE.search(msg)
-        if m:
-            try:
-                wid = int(m.group(1))
-                if wid in self.SILENCE_WEBHOOK_IDS:
-                    return False
-            except ValueError:
-                pass
+        if ids:
+            m = _WEBHOOK_ID_RE.search(msg)
+            if m:
+                try:
+                    if int(m.group(1)) in ids:
+                        return False
+                except ValueError:
+                    pass
 
         # Match explicit author token
-        m2 = _AUTHOR_RE.search(msg)
-        if m2 and m2.group(1) in self.SILENCE_WEBHOOK_NAMES:
-            return False
+        if names:
+            m2 = _AUTHOR_RE.search(msg)
+            if m2 and m2.group(1) in names:
+                return False
 
         return True
 
@@ -119,12 +138,37 @@ def setup_logging():
     fh.addFilter(WebhookNoiseFilter())
 
     # Clear existing handlers on the app logger to avoid duplicates
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
     for h in list(app_logger.handlers):
         app_logger.removeHandler(h)
 
-    app_logger.addHandler(ch)
-    app_logger.addHandler(fh)
-
+    # Callers (including the event loop) only enqueue; a listener thread does
+    # the console/file I/O.
+    listener = _log_listener = logging.handlers.QueueListener(
+        queue.SimpleQueue(), ch, fh, respect_handler_level=True
+    )
+    app_logger.addHandler(logging.handlers.QueueHandler(listener.queue))
+    # ch/fh already cover the console; stop records also hitting root's
+    # StreamHandler, which would write (twice) on the calling thread.
+    app_logger.propagate = False
+    listener.start()
+
+    def _stop_listener():
+        if listener is not _log_listener:
+            return  # superseded by a later setup_logging() call
+        # Drain the queue, then write directly so records from later atexit
+        # hooks (e.g. the bank's final checkpoint) aren't dropped.
+        listener.stop()
+        for h in list(app_logger.handlers):
+            app_logger.removeHandler(h)
+        app_logger.addHandler(ch)
+        app_logger.addHandler(fh)
+
+    atexit.register(_stop_listener)
+
+_log_listener: logging.handlers.QueueListener | None = None
 setup_logging()
 logger = logging.getLogger("gringotts")
 
@@ -146,7 +190,7 @@ TEST_GUILD_ID = 1414423359118376974
 TEST_GUILD = discord.Object(id=TEST_GUILD_ID)
 
 # Channels where messages earn money (include forum PARENT channel IDs)
-ALLOWED_CHANNEL_IDS: set[int] = {
+ALLOWED_CHANNEL_IDS: frozenset[int] = frozenset({
     1414423363056701462, # Events
     1414423364440821799, # Gryffindor Territory
     1414423364612784190, # Hufflepuff Territory
@@ -156,7 +200,7 @@ ALLOWED_CHANNEL_IDS: set[int] = {
     1414423365812355198, # Police and Ministry
     1414423364944138265, # Diagon Alley
     1414423365430804520, # Knockturn Alley
-}
+})
 
 # Bypass per-character cooldown in channels where debug is enabled (handy for testing)
 DEBUG_BYPASS_COOLDOWN = os.getenv("DEBUG_BYPASS_COOLDOWN", "0") == "1"
@@ -196,13 +240,103 @@ STAFF_SHOP_LOG_CHANNEL_ID = int(os.getenv("STAFF_SHOP_LOG_CHANNEL_ID", "0")) or
 # ---------------- BOT SETUP ----------------
 intents = discord.Intents.default()
 intents.message_content = True   # to read message content length
-intents.members = True           # for payday role checks
+intents.members = True           # for payday role checks and cached member lookups (guilds are chunked at startup)
 bot = commands.Bot(command_prefix="!", intents=intents)
 
-# Per-character cooldown: (user_id, normalized_char_name) -> last_time
-last_earn_at: dict[tuple[int, str], float] = {}
+# Per-character cooldown: (user_id, normalized_char_name) -> last time.monotonic().
+# Kept in payout order (oldest first) so expired entries are trimmed from the
+# front; MAX_COOLDOWN_ENTRIES caps it regardless.
+MAX_COOLDOWN_ENTRIES = 10_000
+last_earn_at: OrderedDict[tuple[int, str], float] = OrderedDict()
 
 # ---------------- HELPERS ----------------
+_UTC = datetime.timezone.utc
+
+# Members that had to be fetched over HTTP (not in the gateway cache),
+# keyed by (guild_id, user_id) -> (fetched_at monotonic, member).
+MEMBER_CACHE_TTL_SECONDS = 300
+MEMBER_CACHE_MAX = 10_000
+_member_cache: OrderedDict[tuple[int, int], tuple[float, discord.Member]] = OrderedDict()
+
+def _member_cache_get(guild_id: int, user_id: int) -> discord.Member | None:
+    ent = _member_cache.get((guild_id, user_id))
+    if ent is None:
+        return None
+    if time.monotonic() - ent[0] >= MEMBER_CACHE_TTL_SECONDS:
+        del _member_cache[(guild_id, user_id)]
+        return None
+    return ent[1]
+
+def _member_cache_put(guild_id: int, user_id: int, member: discord.Member) -> None:
+    _member_cache[(guild_id, user_id)] = (time.monotonic(), member)
+    _member_cache.move_to_end((guild_id, user_id))
+    while len(_member_cache) > MEMBER_CACHE_MAX:
+        _member_cache.popitem(last=False)
+
+async def resolve_member(guild: discord.Guild, user_id: int) -> discord.Member:
+    """
+    guild.get_member, then the TTL cache, then fetch_member (which fills the cache).
+    Raises whatever fetch_member raises if the member can't be found.
+    """
+    member = guild.get_member(user_id) or _member_cache_get(guild.id, user_id)
+    if member is None:
+        # Guilds are chunked at ready, so this should only happen for members who left
+        logger.warning("member:fetch_fallback guild_id=%s user_id=%s chunked=%s", guild.id, user_id, guild.chunked)
+        member = await guild.fetch_member(user_id)
+        _member_cache_put(guild.id, user_id, member)
+    return member
+
+# guild_id -> resolved staff log channel/thread (dropped if that channel is deleted)
+_staff_log_channels: dict[int, discord.TextChannel | discord.Thread] = {}
+
+async def _staff_log_channel(guild: discord.Guild) -> discord.TextChannel | discord.Thread | None:
+    """STAFF_SHOP_LOG_CHANNEL_ID in this guild, resolved once; None if unset, missing or not messageable."""
+    if not STAFF_SHOP_LOG_CHANNEL_ID:
+        return None
+    ch = _staff_log_channels.get(guild.id)
+    if ch is not None:
+        return ch
+    # get_channel_or_thread also covers a log *thread*, which guild.get_channel never returns
+    ch = guild.get_channel_or_thread(STAFF_SHOP_LOG_CHANNEL_ID)
+    if ch is None:
+        try:
+            ch = await guild.fetch_channel(STAFF_SHOP_LOG_CHANNEL_ID)
+        except Exception:
+            logger.exception("staff_log:fetch_failed guild_id=%s channel_id=%s", guild.id, STAFF_SHOP_LOG_CHANNEL_ID)
+            return None
+    if not isinstance(ch, (discord.TextChannel, discord.Thread)):
+        return None  # bad channel id or missing perms
+    _staff_log_channels[guild.id] = ch
+    return ch
+
+@bot.listen("on_guild_channel_delete")
+async def _forget_staff_log_channel(channel: discord.abc.GuildChannel):
+    if channel.id == STAFF_SHOP_LOG_CHANNEL_ID:
+        _staff_log_channels.pop(channel.guild.id, None)
+
+@bot.listen("on_raw_thread_delete")
+async def _forget_staff_log_thread(payload: discord.RawThreadDeleteEvent):
+    if payload.thread_id == STAFF_SHOP_LOG_CHANNEL_ID:
+        _staff_log_channels.pop(payload.guild_id, None)
+
+def _fmt_price(kn: int | None) -> str:
+    if kn is None:
+        return "—"
+    return Money(kn).pretty_long()
+
+def _fmt_stock(st) -> str:
+    if st is None:
+        return "∞"
+    if st == -1:
+        return "—"
+    return str(st)
+
+_SHOP_LOG_COLORS = {
+    "Add": discord.Color.green(),
+    "Update": discord.Color.blurple(),
+    "Remove": discord.Color.red(),
+}
+_SHOP_LOG_DEFAULT_COLOR = discord.Color.greyple()
 
 async def _post_shop_log(
     guild: discord.Guild,
@@ -218,33 +352,14 @@ async def _post_shop_log(
     """
     Posts an embed to STAFF_SHOP_LOG_CHANNEL_ID if configured.
     """
-    if not STAFF_SHOP_LOG_CHANNEL_ID:
-        return  # silently skip if not configured
+    ch = await _staff_log_channel(guild)
+    if ch is None:
+        return  # not configured, bad channel id or missing perms
 
-    ch = guild.get_channel(STAFF_SHOP_LOG_CHANNEL_ID) or await guild.fetch_channel(STAFF_SHOP_LOG_CHANNEL_ID)
-    if not isinstance(ch, (discord.TextChannel, discord.Thread)):
-        return  # bad channel id or missing perms
-
-    def _fmt_price(kn: int | None) -> str:
-        if kn is None: 
-            return "—"
-        return Money(kn).pretty_long()
-
-    def _fmt_stock(st) -> str:
-        if st is None: 
-            return "∞"
-        if st == -1:
-            return "—"
-        return str(st)
-
-    color = {
-        "Add": discord.Color.green(),
-        "Update": discord.Color.blurple(),
-        "Remove": discord.Color.red(),
-    }.get(action, discord.Color.greyple())
+    color = _SHOP_LOG_COLORS.get(action, _SHOP_LOG_DEFAULT_COLOR)
 
     title = f"{action} Item"
-    e = discord.Embed(title=title, color=color, timestamp=datetime.datetime.utcnow())
+    e = discord.Embed(title=title, color=color, timestamp=datetime.datetime.now(_UTC))
     e.add_field(name="Shop", value=shop, inline=True)
     e.add_field(name="Item", value=item, inline=True)
 
@@ -268,43 +383,104 @@ async def _post_shop_log(
         # Avoid crashing command flows if channel perms are missing
         logger.exception("Failed to post shop log embed")
 
-async def _post_inventory_embed(guild: discord.Guild, embed: discord.Embed):
+async def _post_inventory_embed(guild: discord.Guild, embed: discord.Embed | list[discord.Embed]):
     """
-    Post an inventory embed to the staff shop log channel, if configured.
+    Post an inventory embed (or a list of pages, one message each) to the staff shop log channel, if configured.
     """
-    if not STAFF_SHOP_LOG_CHANNEL_ID:
+    ch = await _staff_log_channel(guild)
+    if ch is None:
         return
 
     try:
-        ch = guild.get_channel(STAFF_SHOP_LOG_CHANNEL_ID) or await guild.fetch_channel(STAFF_SHOP_LOG_CHANNEL_ID)
-        if isinstance(ch, (discord.TextChannel, discord.Thread)):
-            await ch.send(embed=embed)
+        for page in (embed if isinstance(embed, list) else (embed,)):
+            await ch.send(embed=page)
     except Exception:
         logger.exception("Failed to post inventory embed")
 
+EMBED_MAX_FIELDS = 25  # Discord's per-embed field limit
+
+def _paged_embeds(
+    title: str, color: discord.Color, fields: list[tuple[str, str]]
+) -> list[discord.Embed]:
+    """
+    Split (name, value) fields into embeds of at most EMBED_MAX_FIELDS fields.
+    Pages after the first get a "(page i/n)" title suffix.
+    """
+    if len(fields) <= EMBED_MAX_FIELDS:
+        # Common case: one page, no slicing
+        e = discord.Embed(title=title, color=color)
+        add = e.add_field
+        for name, value in fields:
+            add(name=name, value=value, inline=False)
+        return [e]
+
+    n_pages = -(-len(fields) // EMBED_MAX_FIELDS)
+    it = iter(fields)
+    pages: list[discord.Embed] = []
+    for i in range(1, n_pages + 1):
+        e = discord.Embed(title=f"{title} (page {i}/{n_pages})", color=color)
+        add = e.add_field
+        for name, value in itertools.islice(it, EMBED_MAX_FIELDS):
+            add(name=name, value=value, inline=False)
+        pages.append(e)
+    return pages
+
 
 
 # ---------------- SHOP HELPERS (JSON store with stock math) ----------------
-SHOPS_FILE = os.path.join(DATA_DIR, "shops.json")
+# (file signature, parsed data). Callers share the dict: mutate it only on the way
+# to _shops_save_atomic, which re-keys the cache to the file it just wrote.
+_shops_cache: tuple[tuple, dict] | None = None
 
 def _shops_load() -> dict:
-    if not os.path.exists(SHOPS_FILE):
+    global _shops_cache
+    sig = file_sig(SHOPS_FILE)
+    if sig is None:
         return {}
+    if _shops_cache is not None and _shops_cache[0] == sig:
+        return _shops_cache[1]
     try:
-        with open(SHOPS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
+        if orjson is not None:
+            with open(SHOPS_FILE, "rb") as f:
+                data = orjson.loads(f.read())
+        else:
+            with open(SHOPS_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+    except json.JSONDecodeError:  # orjson.JSONDecodeError subclasses this
         return {}
+    _shops_cache = (sig, data)
+    return data
 
 def _shops_save_atomic(data: dict) -> None:
+    global _shops_cache
     d = os.path.dirname(SHOPS_FILE) or "."
     tmp = os.path.join(d, f".tmp_{os.path.basename(SHOPS_FILE)}")
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    os.replace(tmp, SHOPS_FILE)
+    try:
+        if orjson is not None:
+            payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)  # UTF-8, like ensure_ascii=False
+        else:
+            payload = json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, SHOPS_FILE)
+    except Exception:
+        _shops_cache = None  # data may hold unsaved edits; re-read the file next time
+        raise
+    sig = file_sig(SHOPS_FILE)
+    _shops_cache = (sig, data) if sig is not None else None
+
+# Shop edits hold this from load to save: the dict they mutate is the shared cached
+# one, and it must not change while a worker thread is serializing it.
+_shops_write_lock = asyncio.Lock()
 
-def _get_item(shop: str, item: str) -> dict | None:
-    return _shops_load().get(shop, {}).get(item)
+async def _shops_save_async(data: dict) -> None:
+    """_shops_save_atomic on a worker thread. Call with _shops_write_lock held."""
+    await asyncio.to_thread(_shops_save_atomic, data)
+
+def _get_item(shop: str, item: str, data: dict | None = None) -> dict | None:
+    if data is None:
+        data = _shops_load()
+    return data.get(shop, {}).get(item)
 
 def _set_item_record(shop: str, item: str, price_knuts: int, stock: int | None) -> None:
     data = _shops_load()
@@ -312,22 +488,20 @@ def _set_item_record(shop: str, item: str, price_knuts: int, stock: int | None)
     shop_dict[item] = {"price_knuts": int(price_knuts), "stock": (None if stock is None else int(stock))}
     _shops_save_atomic(data)
 
-def _add_stock(shop: str, item: str, price: Money, qty: int) -> tuple[str, dict]:
+def _add_stock(data: dict, shop: str, item: str, price: Money, qty: int) -> tuple[str, dict]:
     """
-    Create or restock an item.
+    Create or restock an item in `data` (in place; the caller saves).
     Returns (action, new_record) where action is 'Add' (new) or 'Restock' (existing).
     Unlimited stock is represented as None; if existing is None, qty has no effect.
     """
     if qty <= 0:
         raise ValueError("Quantity must be positive.")
-    data = _shops_load()
     shop_dict = data.setdefault(shop, {})
     rec = shop_dict.get(item)
     if rec is None:
         # New item with finite initial stock (defaulted by caller to >=1)
         rec = {"price_knuts": int(price.knuts), "stock": int(qty)}
         shop_dict[item] = rec
-        _shops_save_atomic(data)
         return "Add", rec
 
     # Existing item: update price (keep latest) and increase stock if finite
@@ -338,18 +512,17 @@ def _add_stock(shop: str, item: str, price: Money, qty: int) -> tuple[str, dict]
         pass
     else:
         rec["stock"] = int(old_stock) + int(qty)
-    _shops_save_atomic(data)
     return "Restock", rec
 
-def _remove_stock(shop: str, item: str, qty: int) -> dict:
+def _remove_stock(data: dict, shop: str, item: str, qty: int) -> dict:
     """
-    Decrease stock by qty (>=1). Errors if item missing or would go below 0.
+    Decrease stock by qty (>=1) in `data` (in place; the caller saves).
+    Errors if item missing or would go below 0.
     If stock is unlimited (None), we treat removal as not allowed (raises ValueError).
     Returns the updated record.
     """
     if qty <= 0:
         raise ValueError("Quantity must be positive.")
-    data = _shops_load()
     shop_dict = data.get(shop) or {}
     rec = shop_dict.get(item)
     if rec is None:
@@ -360,24 +533,80 @@ def _remove_stock(shop: str, item: str, qty: int) -> dict:
     if new_stock < 0:
         raise ValueError("Removal would make stock negative.")
     rec["stock"] = new_stock
-    _shops_save_atomic(data)
     return rec
 
 # (Optional) autocompletes
 from discord import app_commands as _ac
 
-async def _ac_shop_names(_: discord.Interaction, current: str):
+AC_MAX_CHOICES = 25  # Discord's autocomplete limit
+
+# Autocomplete index: sorted (lowercased, name) pairs for shops and per-shop items,
+# rebuilt only when shops.json changes (keyed by its (mtime_ns, size)).
+_ac_index_sig: tuple | None = None
+_ac_shops_idx: list[tuple[str, str]] = []
+_ac_items_idx: dict[str, list[tuple[str, str]]] = {}
+
+def _ac_refresh_index() -> None:
+    global _ac_index_sig, _ac_shops_idx, _ac_items_idx
+    sig = file_sig(SHOPS_FILE)
+    if sig == _ac_index_sig and sig is not None:
+        return
+    data = _shops_load()
+    _ac_shops_idx = sorted((name.lower(), name) for name in data)
+    _ac_items_idx = {
+        shop: sorted((item.lower(), item) for item in (items or {}))
+        for shop, items in data.items()
+    }
+    _ac_index_sig = sig
+
+def _ac_match(index: list[tuple[str, str]], current: str) -> list[str]:
+    """Prefix matches first (bisect on the sorted index), then other substring matches."""
     cur = (current or "").lower()
-    names = sorted(_shops_load().keys())
-    return [_ac.Choice(name=s, value=s) for s in names if cur in s.lower()][:25]
+    if not cur:
+        return [name for _, name in index[:AC_MAX_CHOICES]]
+    lo = bisect.bisect_left(index, (cur,))
+    out = []
+    i = lo
+    while i < len(index) and index[i][0].startswith(cur) and len(out) < AC_MAX_CHOICES:
+        out.append(index[i][1])
+        i += 1
+    prefix_end = i
+    for j, (low, name) in enumerate(index):
+        if len(out) >= AC_MAX_CHOICES:
+            break
+        if lo <= j < prefix_end:
+            continue
+        if cur in low:
+            out.append(name)
+    return out
+
+# Memoized responses keyed on (index signature, shop, current). Keystroke bursts repeat
+# the same prefixes; a catalog change alters the signature, so stale keys just age out.
+AC_MEMO_MAX = 1024
+_ac_memo: "OrderedDict[tuple, list]" = OrderedDict()
+
+def _ac_choices(shop: str | None, current: str) -> list:
+    _ac_refresh_index()
+    key = (_ac_index_sig, shop, current or "")
+    hit = _ac_memo.get(key)
+    if hit is not None:
+        _ac_memo.move_to_end(key)
+        return list(hit)
+    index = _ac_shops_idx if shop is None else _ac_items_idx.get(shop, [])
+    choices = [_ac.Choice(name=n, value=n) for n in _ac_match(index, current)]
+    _ac_memo[key] = choices
+    if len(_ac_memo) > AC_MEMO_MAX:
+        _ac_memo.popitem(last=False)
+    return list(choices)
+
+async def _ac_shop_names(_: discord.Interaction, current: str):
+    return _ac_choices(None, current)
 
 async def _ac_item_names(interaction: discord.Interaction, current: str):
     shop = getattr(interaction.namespace, "shop", None)
-    items = []
-    if shop:
-        items = sorted((_shops_load().get(shop) or {}).keys())
-    cur = (current or "").lower()
-    return [_ac.Choice(name=i, value=i) for i in items if cur in i.lower()][:25]
+    if not shop:
+        return []
+    return _ac_choices(shop, current)
 
 
 
@@ -405,61 +634,135 @@ def _pending_load() -> dict:
     if not os.path.exists(PENDING_FILE):
         return {}
     try:
+        if orjson is not None:
+            with open(PENDING_FILE, "rb") as f:
+                return orjson.loads(f.read())
         with open(PENDING_FILE, "r", encoding="utf-8") as f:
             return json.load(f)
-    except json.JSONDecodeError:
+    except json.JSONDecodeError:  # orjson.JSONDecodeError subclasses this
         return {}
 
 def _pending_save_atomic(data: dict) -> None:
     d = os.path.dirname(PENDING_FILE) or "."
     tmp = os.path.join(d, f".tmp_{os.path.basename(PENDING_FILE)}")
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    if orjson is not None:
+        payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    else:
+        payload = json.dumps(data, indent=2).encode("utf-8")
+    with open(tmp, "wb") as f:
+        f.write(payload)
     os.replace(tmp, PENDING_FILE)
 
 def _utc_datestr(dt: datetime.datetime | None = None) -> str:
-    dt = dt or datetime.datetime.now(datetime.timezone.utc)
+    dt = dt or datetime.datetime.now(_UTC)
     return dt.strftime("%Y-%m-%d")
 
+# Resident copy of pending_receipts.json. queue_rp_earning only touches memory;
+# flush_pending_receipts writes it back every couple of seconds when dirty.
+# In memory each leaf is a compact [knuts, count] list instead of the on-disk
+# {"knuts": .., "count": ..} dict; conversion happens only at load and save.
+def _pending_from_json(data: dict) -> dict:
+    out: dict = {}
+    for day, day_bucket in data.items():
+        for gkey, entries in day_bucket.items():
+            g = out.setdefault(day, {}).setdefault(gkey, {})
+            for uck, rec in entries.items():
+                g[uck] = [int(rec.get("knuts", 0)), int(rec.get("count", 0))]
+    return out
+
+def _pending_to_json(mem: dict) -> dict:
+    # Builds fresh dicts at every level, so the result is also a safe snapshot
+    # for the writer thread while the event loop keeps mutating _pending_mem.
+    return {
+        day: {
+            gkey: {uck: {"knuts": rec[0], "count": rec[1]} for uck, rec in entries.items()}
+            for gkey, entries in day_bucket.items()
+        }
+        for day, day_bucket in mem.items()
+    }
+
+_pending_mem: dict = _pending_from_json(_pending_load())
+_pending_dirty = False
+
+def _pending_flush() -> None:
+    global _pending_dirty
+    if not _pending_dirty:
+        return
+    _pending_dirty = False
+    try:
+        _pending_save_atomic(_pending_to_json(_pending_mem))
+    except Exception:
+        _pending_dirty = True
+        logger.exception("pending:save_failed path='%s'", PENDING_FILE)
+
+atexit.register(_pending_flush)
+
+_pending_write_lock = asyncio.Lock()
+
+async def _pending_flush_async() -> None:
+    """Like _pending_flush, but encodes and writes on a worker thread."""
+    global _pending_dirty
+    async with _pending_write_lock:  # one writer at a time on the shared temp file
+        if not _pending_dirty:
+            return
+        _pending_dirty = False
+        try:
+            await asyncio.to_thread(_pending_save_atomic, _pending_to_json(_pending_mem))
+        except Exception:
+            _pending_dirty = True
+            logger.exception("pending:save_failed path='%s'", PENDING_FILE)
+
 def queue_rp_earning(guild_id: int, user_id: int, char_key: str, delta_knuts: int) -> None:
     """
     Accumulate today's total (UTC) RP earnings per (guild, user, character).
     """
-    data = _pending_load()
+    global _pending_dirty
+    data = _pending_mem
     day = _utc_datestr()
     gkey = str(guild_id)
     uck = f"{user_id}:{char_key}"
 
     day_bucket = data.setdefault(day, {})
     guild_bucket = day_bucket.setdefault(gkey, {})
-    rec = guild_bucket.setdefault(uck, {"knuts": 0, "count": 0})
-    rec["knuts"] += int(delta_knuts)
-    rec["count"] += 1
+    rec = guild_bucket.get(uck)
+    if rec is None:
+        guild_bucket[uck] = [int(delta_knuts), 1]
+    else:
+        rec[0] += int(delta_knuts)
+        rec[1] += 1
+    _pending_dirty = True
 
-    _pending_save_atomic(data)
+def _channel_ids(ch):
+    """
+    Yield the ids that can put a channel on the allowlist, cheapest first: the
+    channel itself, then its parent (threads) and the category. For a thread the
+    parent's id is parent_id and its category is the parent's; the category is
+    read off the cached parent because Thread.category_id raises if it isn't cached.
+    """
+    yield ch.id
+    parent_id = getattr(ch, "parent_id", None)
+    if parent_id is None:
+        yield getattr(ch, "category_id", None)
+        return
+    yield parent_id
+    parent = ch.parent
+    if parent is not None:
+        yield parent.category_id
 
 def is_earning_channel_with_details(
     ch: discord.abc.GuildChannel | discord.Thread
 ) -> tuple[bool, dict]:
-    ids_to_check: list[int] = []
-    ids_to_check.append(getattr(ch, "id", None))
-    ids_to_check.append(getattr(ch, "parent_id", None))
-    ids_to_check.append(getattr(ch, "category_id", None))
-
-    parent = getattr(ch, "parent", None)
-    if parent is not None:
-        ids_to_check.append(getattr(parent, "id", None))
-        ids_to_check.append(getattr(parent, "parent_id", None))
-        ids_to_check.append(getattr(parent, "category_id", None))
-
-    ids_to_check = [cid for cid in ids_to_check if cid]
+    ids_to_check = [cid for cid in _channel_ids(ch) if cid]
     matched = [cid for cid in ids_to_check if cid in ALLOWED_CHANNEL_IDS]
     allowed = bool(matched)
+    is_thread = isinstance(ch, discord.Thread)
+    parent = ch.parent if is_thread else None
     details = {
         "channel_type": type(ch).__name__,
         "channel_id": getattr(ch, "id", None),
         "parent_id": getattr(ch, "parent_id", None),
-        "category_id": getattr(ch, "category_id", None),
+        # A thread's own category is its parent's (Thread.category_id raises when that isn't cached)
+        "category_id": getattr(parent, "category_id", None) if is_thread else getattr(ch, "category_id", None),
         "parent_type": type(parent).__name__ if parent else None,
         "parent_category_id": getattr(parent, "category_id", None) if parent else None,
         "ids_checked": ids_to_check,
@@ -470,27 +773,27 @@ def is_earning_channel_with_details(
 
 def is_earning_channel(message: discord.Message) -> bool:
     """Allow by channel ID, its parent (e.g., forum or text channel), or their category."""
-    ch = message.channel
-    ids_to_check: set[int] = set()
-    ids_to_check.add(getattr(ch, "id", None))
-    ids_to_check.add(getattr(ch, "parent_id", None))
-    ids_to_check.add(getattr(ch, "category_id", None))
-    parent = getattr(ch, "parent", None)
-    if parent is not None:
-        ids_to_check.add(getattr(parent, "id", None))
-        ids_to_check.add(getattr(parent, "parent_id", None))
-        ids_to_check.add(getattr(parent, "category_id", None))
-    return any(cid in ALLOWED_CHANNEL_IDS for cid in ids_to_check if cid)
+    # Short-circuits on the first hit; None is never in the set
+    allowed = ALLOWED_CHANNEL_IDS
+    return any(cid in allowed for cid in _channel_ids(message.channel))
 
 def can_payout(owner_user_id: int, char_key: str | None) -> bool:
-    """Per-user+character cooldown."""
-    now = time.time()
-    key = (owner_user_id, (char_key or "").lower())
-    last = last_earn_at.get(key, 0.0)
-    if now - last >= EARN_COOLDOWN_SECONDS:
-        last_earn_at[key] = now
-        return True
-    return False
+    """Per-user+character cooldown. char_key must already be normalized (normalize_display_name)."""
+    now = time.monotonic()  # immune to wall-clock jumps
+    key = (owner_user_id, char_key or "")
+    last = last_earn_at.get(key)
+    if last is not None and now - last < EARN_COOLDOWN_SECONDS:
+        return False
+
+    last_earn_at[key] = now
+    last_earn_at.move_to_end(key)
+    # Entries past the cooldown behave like missing ones; drop them lazily
+    while last_earn_at:
+        oldest = next(iter(last_earn_at.values()))
+        if now - oldest < EARN_COOLDOWN_SECONDS and len(last_earn_at) <= MAX_COOLDOWN_ENTRIES:
+            break
+        last_earn_at.popitem(last=False)
+    return True
 
 async def deposit_to_character(
     interaction_or_guild: discord.Interaction | discord.Guild,
@@ -500,8 +803,7 @@ async def deposit_to_character(
     amount: Money,
     reason: str | None = None
 ) -> None:
-    add_balance(user_id, amount, key=char_key)
-    new_bal = get_balance(user_id, key=char_key)
+    new_bal = add_balance(user_id, amount, key=char_key)
     await post_receipt(bot, guild, user_id, char_key, amount, new_bal, reason)
 
 async def withdraw_from_character(
@@ -511,15 +813,46 @@ async def withdraw_from_character(
     char_key: str,
     amount: Money,
     reason: str | None = None
-) -> bool:
-    if not subtract_if_enough(user_id, amount, key=char_key):
-        return False
-    new_bal = get_balance(user_id, key=char_key)
+) -> tuple[bool, Money]:
+    """Returns (ok, balance): the new balance on success, the unchanged one if funds were short."""
+    ok, bal = try_subtract(user_id, amount, key=char_key)
+    if not ok:
+        return False, bal
     neg = Money(-amount.knuts)
-    await post_receipt(bot, guild, user_id, char_key, neg, new_bal, reason)
-    return True
+    await post_receipt(bot, guild, user_id, char_key, neg, bal, reason)
+    return True, bal
+
+# ---------------- COMMAND SYNC ----------------
+# Hash of the last command payload synced to TEST_GUILD; sync is skipped while it matches.
+SYNC_HASH_FILE = os.path.join(DATA_DIR, ".sync_hash")
+FORCE_COMMAND_SYNC = os.getenv("FORCE_COMMAND_SYNC", "0") == "1"
+
+def _command_tree_hash() -> str:
+    """sha256 over exactly what tree.sync would upload for TEST_GUILD (plus the guild id)."""
+    payload = [c.to_dict(bot.tree) for c in bot.tree.get_commands(guild=TEST_GUILD)]
+    payload.sort(key=lambda d: (d.get("type", 1), d["name"]))
+    blob = json.dumps({"guild": TEST_GUILD_ID, "commands": payload}, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def _read_sync_hash() -> str | None:
+    try:
+        with open(SYNC_HASH_FILE, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def _write_sync_hash(h: str) -> None:
+    tmp = f"{SYNC_HASH_FILE}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(h)
+        os.replace(tmp, SYNC_HASH_FILE)
+    except OSError:
+        logger.exception("sync:hash_write_failed path='%s'", SYNC_HASH_FILE)
 
 # ---------------- EVENTS ----------------
+_heap_frozen = False
+
 @bot.event
 async def on_ready():
     # Guaranteed startup log
@@ -527,17 +860,44 @@ async def on_ready():
                 bot.user, len(bot.guilds), LOG_LEVEL, LOG_FILE)
     try:
         bot.tree.copy_global_to(guild=TEST_GUILD)
-        synced = await bot.tree.sync(guild=TEST_GUILD)
-        logger.info(f"Synced {len(synced)} commands to {TEST_GUILD_ID}: {[c.name for c in synced]}")
+        tree_hash = _command_tree_hash()
+        if not FORCE_COMMAND_SYNC and tree_hash == _read_sync_hash():
+            logger.info("sync:skipped unchanged command tree guild_id=%s hash=%s", TEST_GUILD_ID, tree_hash[:12])
+        else:
+            synced = await bot.tree.sync(guild=TEST_GUILD)
+            _write_sync_hash(tree_hash)
+            logger.info("Synced %s commands to %s: %s", len(synced), TEST_GUILD_ID, [c.name for c in synced])
     except Exception as e:
-        logger.exception(f"[SYNC ERROR] {type(e).__name__}: {e}")
+        logger.exception("[SYNC ERROR] %s: %s", type(e).__name__, e)
 
     if not weekly_payday.is_running():
         weekly_payday.start()
     if not flush_daily_receipts.is_running():
         flush_daily_receipts.start()
+    if not flush_pending_receipts.is_running():
+        flush_pending_receipts.start()
 
-    logger.info(f"Bot ready as {bot.user} in {len(bot.guilds)} guild(s).")
+    # discord.py chunks guilds before on_ready with the members intent, but a chunk
+    # request can time out on large guilds; fill any gaps so get_member stays local.
+    for guild in bot.guilds:
+        if not guild.chunked:
+            try:
+                await guild.chunk(cache=True)
+                logger.info("startup: chunked guild_id=%s members=%s", guild.id, guild.member_count)
+            except Exception:
+                logger.exception("startup: chunk_failed guild_id=%s", guild.id)
+
+    # Startup state (command tree, caches, loaded JSON) lives for the whole run;
+    # move it out of the GC's scanned generations. on_ready fires again on
+    # reconnects, so only do this the first time.
+    global _heap_frozen
+    if not _heap_frozen:
+        gc.collect()
+        gc.freeze()
+        _heap_frozen = True
+        logger.info("startup: gc frozen objects=%s", gc.get_freeze_count())
+
+    logger.info("Bot ready as %s in %s guild(s).", bot.user, len(bot.guilds))
 
 @bot.event
 async def on_message(message: discord.Message):
@@ -548,92 +908,129 @@ async def on_message(message: discord.Message):
     dbg = _debug_enabled_for_channel(message.channel)
 
     # HEARTBEAT (always emit in traced channels)
-    if dbg:
+    if dbg and logger.isEnabledFor(logging.INFO):
         logger.info(
-            "debug:earn_heartbeat | "
-            f"guild_id={getattr(message.guild, 'id', None)} "
-            f"message_id={getattr(message, 'id', None)} "
-            f"webhook_id={getattr(message, 'webhook_id', None)} "
-            f"author='{getattr(message.author, 'name', None)}' "
-            f"channel_id={getattr(message.channel, 'id', None)} "
-            f"parent_id={getattr(message.channel, 'parent_id', None)} "
-            f"len={len((getattr(message, 'content', '') or '').strip())}"
+            "debug:earn_heartbeat | guild_id=%s message_id=%s webhook_id=%s author='%s' "
+            "channel_id=%s parent_id=%s len=%s",
+            getattr(message.guild, 'id', None),
+            getattr(message, 'id', None),
+            getattr(message, 'webhook_id', None),
+            getattr(message.author, 'name', None),
+            getattr(message.channel, 'id', None),
+            getattr(message.channel, 'parent_id', None),
+            len((getattr(message, 'content', '') or '').strip()),
         )
 
+    _try_credit_rp(message, dbg)
+    # process_commands ignores bot authors, which includes every webhook/proxy
+    # post; skip building and awaiting the coroutine for those.
+    if not message.author.bot:
+        await bot.process_commands(message)
+
+def _try_credit_rp(
+    message: discord.Message,
+    dbg: bool,
+    *,
+    # Hot path: bind globals as defaults so lookups are locals (LOAD_FAST)
+    _channel_check=is_earning_channel,
+    _resolve=resolve_with_key,
+    _can_payout=can_payout,
+    _add=add_balance,
+    _queue=queue_rp_earning,
+    _MIN_LEN=MIN_MESSAGE_LENGTH,
+    _EARN=EARN_PER_MESSAGE,
+) -> None:
+    """
+    Credit EARN_PER_MESSAGE if this message qualifies. Synchronous, so every
+    early exit is a plain return and on_message has a single await tail.
+    """
     # Only award for proxied/webhook messages (Tupperbox etc.)
     if not message.webhook_id:
         if dbg:
             logger.info("debug:earn_skip reason='not_webhook'")
-        await bot.process_commands(message)
         return
 
     # Channel allowlist
-    allowed, ch_details = is_earning_channel_with_details(message.channel)
+    # Cheap check on the hot path; the details dict is only built when tracing
+    allowed = _channel_check(message)
+    if dbg:
+        _, ch_details = is_earning_channel_with_details(message.channel)
+        if allowed:
+            logger.info("debug:earn_check channel_allowed=True | %s", ch_details)
+        else:
+            logger.info("debug:earn_skip reason='channel_not_allowed' | %s", ch_details)
     if not allowed:
-        if dbg:
-            logger.info(f"debug:earn_skip reason='channel_not_allowed' | {ch_details}")
-        await bot.process_commands(message)
         return
-    elif dbg:
-        logger.info(f"debug:earn_check channel_allowed=True | {ch_details}")
 
-    # Content length
-    content = (message.content or "").strip()
-    if len(content) < MIN_MESSAGE_LENGTH:
+    # Content length (strip only shortens, so skip the copy when already too short)
+    content = message.content or ""
+    content_len = len(content)
+    if content_len >= _MIN_LEN:
+        content_len = len(content.strip())
+    if content_len < _MIN_LEN:
         if dbg:
-            logger.info(
-                "debug:earn_skip reason='too_short' "
-                f"min={MIN_MESSAGE_LENGTH} actual={len(content)}"
-            )
-        await bot.process_commands(message)
+            logger.info("debug:earn_skip reason='too_short' min=%s actual=%s", MIN_MESSAGE_LENGTH, content_len)
         return
 
     # Character resolution
     raw_name = message.author.name or ""
     try:
-        char_key = normalize_display_name(raw_name)
-        linked_uid = resolve_character(raw_name)
+        linked_uid, char_key = _resolve(raw_name)
     except Exception as e:
         if dbg:
-            logger.exception(f"debug:earn_skip reason='normalize_or_resolve_exception' name='{raw_name}'")
-        await bot.process_commands(message)
+            logger.exception("debug:earn_skip reason='normalize_or_resolve_exception' name='%s'", raw_name)
         return
 
     if not linked_uid:
         if dbg:
-            logger.info(
-                "debug:earn_skip reason='unlinked_character' "
-                f"name='{raw_name}' char_key='{char_key}'"
-            )
-        await bot.process_commands(message)
+            logger.info("debug:earn_skip reason='unlinked_character' name='%s' char_key='%s'", raw_name, char_key)
         return
     elif dbg:
-        logger.info(f"debug:earn_check linked user_id={linked_uid} char_key='{char_key}'")
+        logger.info("debug:earn_check linked user_id=%s char_key='%s'", linked_uid, char_key)
 
     # Cooldown (with optional bypass while debugging)
-    if not DEBUG_BYPASS_COOLDOWN and not can_payout(linked_uid, char_key):
+    if not DEBUG_BYPASS_COOLDOWN and not _can_payout(linked_uid, char_key):
         if dbg:
             logger.info(
-                "debug:earn_skip reason='cooldown' "
-                f"cooldown_s={EARN_COOLDOWN_SECONDS} user_id={linked_uid} char_key='{char_key}'"
+                "debug:earn_skip reason='cooldown' cooldown_s=%s user_id=%s char_key='%s'",
+                EARN_COOLDOWN_SECONDS, linked_uid, char_key
             )
-        await bot.process_commands(message)
         return
     elif dbg and DEBUG_BYPASS_COOLDOWN:
         logger.info("debug:earn_check cooldown_bypassed=True")
 
     # Success
-    add_balance(linked_uid, EARN_PER_MESSAGE, key=char_key)
-    queue_rp_earning(message.guild.id, linked_uid, char_key, EARN_PER_MESSAGE.knuts)
+    _add(linked_uid, _EARN, key=char_key, defer_log=True)
+    _queue(message.guild.id, linked_uid, char_key, _EARN.knuts)
     if dbg:
         logger.info(
-            "debug:earn_ok "
-            f"delta='{EARN_PER_MESSAGE.pretty_long()}' user_id={linked_uid} char_key='{char_key}'"
+            "debug:earn_ok delta='%s' user_id=%s char_key='%s'",
+            EARN_PER_MESSAGE.pretty_long(), linked_uid, char_key
         )
 
-    await bot.process_commands(message)
-
 # ---------------- SLASH COMMANDS ----------------
+# Error replies shared by several commands
+_ERR_AMOUNT_FORMAT = "❌ Amount format not recognized. Try `2g 5s`, `15s`, or `300k`."
+_ERR_AMOUNT_POSITIVE = "❌ Amount must be positive."
+_ERR_QTY_POSITIVE = "❌ Quantity must be a positive number."
+_ERR_ITEM_NOT_FOUND = "❌ Item not found."
+_ERR_NO_LINK = "❌ No link for **{}**."
+_ERR_UNEXPECTED = "❌ Something went wrong; please try again or ask staff."
+
+@contextlib.asynccontextmanager
+async def _followup_on_error(interaction: discord.Interaction, what: str):
+    """
+    For commands that have deferred: log any exception from the body and still send
+    a followup, so the user isn't left on "thinking…" forever.
+    """
+    try:
+        yield
+    except Exception:
+        logger.exception("%s:failed user_id=%s", what, interaction.user.id)
+        try:
+            await interaction.followup.send(_ERR_UNEXPECTED, ephemeral=True)
+        except discord.HTTPException:
+            pass
 
 # ---------------- SHOP COMMANDS (staff-only) ----------------
 
@@ -656,7 +1053,7 @@ async def add_item_cmd(
     # Validate quantity default
     qty = int(quantity or 1)
     if qty <= 0:
-        await interaction.response.send_message("❌ Quantity must be a positive number.", ephemeral=True)
+        await interaction.response.send_message(_ERR_QTY_POSITIVE, ephemeral=True)
         return
 
     try:
@@ -668,14 +1065,26 @@ async def add_item_cmd(
         )
         return
 
-    existing = _get_item(shop, item)
-    old_price_knuts = existing["price_knuts"] if existing else None
-    old_stock = existing["stock"] if existing else None
+    # One load for the whole read-modify-write
+    async with _shops_write_lock:
+        data = _shops_load()
+        existing = _get_item(shop, item, data)
+        old_price_knuts = existing["price_knuts"] if existing else None
+        old_stock = existing["stock"] if existing else None
 
-    try:
-        action, rec = _add_stock(shop, item, money, qty)
-    except Exception as e:
-        await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+        error = None
+        try:
+            action, rec = _add_stock(data, shop, item, money, qty)
+        except ValueError as ve:
+            error = f"❌ {ve}"
+        else:
+            try:
+                await _shops_save_async(data)
+            except Exception:
+                logger.exception("shop:add_item_save_failed shop='%s' item='%s'", shop, item)
+                error = _ERR_UNEXPECTED
+    if error is not None:
+        await interaction.response.send_message(error, ephemeral=True)
         return
 
     stock_text = "∞" if rec.get("stock") is None else str(rec.get("stock"))
@@ -720,24 +1129,32 @@ async def remove_item_cmd(
 ):
     qty = int(quantity or 1)
     if qty <= 0:
-        await interaction.response.send_message("❌ Quantity must be a positive number.", ephemeral=True)
+        await interaction.response.send_message(_ERR_QTY_POSITIVE, ephemeral=True)
         return
 
-    existing = _get_item(shop, item)
-    if not existing:
-        await interaction.response.send_message("❌ Item not found.", ephemeral=True)
-        return
-
-    old_price_knuts = existing.get("price_knuts")
-    old_stock = existing.get("stock")
-
-    try:
-        rec = _remove_stock(shop, item, qty)
-    except ValueError as ve:
-        await interaction.response.send_message(f"❌ {ve}", ephemeral=True)
-        return
-    except KeyError:
-        await interaction.response.send_message("❌ Item not found.", ephemeral=True)
+    async with _shops_write_lock:
+        data = _shops_load()
+        existing = _get_item(shop, item, data)
+        if not existing:
+            error = _ERR_ITEM_NOT_FOUND
+        else:
+            old_price_knuts = existing.get("price_knuts")
+            old_stock = existing.get("stock")
+            try:
+                rec = _remove_stock(data, shop, item, qty)
+                error = None
+            except ValueError as ve:
+                error = f"❌ {ve}"
+            except KeyError:
+                error = _ERR_ITEM_NOT_FOUND
+            else:
+                try:
+                    await _shops_save_async(data)
+                except Exception:
+                    logger.exception("shop:remove_item_save_failed shop='%s' item='%s'", shop, item)
+                    error = _ERR_UNEXPECTED
+    if error is not None:
+        await interaction.response.send_message(error, ephemeral=True)
         return
 
     new_stock_text = "∞" if rec.get("stock") is None else str(rec.get("stock"))
@@ -785,11 +1202,12 @@ async def inventory_cmd(
         if not data:
             await interaction.response.send_message("No shops configured.", ephemeral=True)
             return
-        e = discord.Embed(title="Shops", color=discord.Color.blurple())
-        for s in sorted(data.keys()):
-            e.add_field(name=s, value=f"{len(data[s])} item(s)", inline=False)
+        pages = _paged_embeds(
+            "Shops", discord.Color.blurple(),
+            [(s, f"{len(data[s])} item(s)") for s in sorted(data.keys())],
+        )
         await interaction.response.send_message("📦 Inventory list posted to staff log.", ephemeral=True)
-        await _post_inventory_embed(interaction.guild, e)
+        await _post_inventory_embed(interaction.guild, pages)
         return
 
     # Shop provided, maybe item
@@ -812,17 +1230,15 @@ async def inventory_cmd(
         await _post_inventory_embed(interaction.guild, e)
         return
 
-    # List all items in the shop
-    e = discord.Embed(title=f"Inventory — {shop}", color=discord.Color.green())
-    if not shop_items:
-        e.description = "_No items._"
-    else:
-        for name, rec in sorted(shop_items.items()):
-            price = Money(rec["price_knuts"]).pretty_long()
-            stock_text = "∞" if rec.get("stock") is None else str(rec.get("stock"))
-            e.add_field(name=name, value=f"Price: {price}\nStock: {stock_text}", inline=False)
+    # List all items in the shop (shop_items is non-empty here)
+    fields = []
+    for name, rec in sorted(shop_items.items()):
+        price = Money(rec["price_knuts"]).pretty_long()
+        stock_text = "∞" if rec.get("stock") is None else str(rec.get("stock"))
+        fields.append((name, f"Price: {price}\nStock: {stock_text}"))
+    pages = _paged_embeds(f"Inventory — {shop}", discord.Color.green(), fields)
     await interaction.response.send_message(f"📦 Shop **{shop}** inventory posted to staff log.", ephemeral=True)
-    await _post_inventory_embed(interaction.guild, e)
+    await _post_inventory_embed(interaction.guild, pages)
 
 
 # Autocompletes
@@ -852,29 +1268,27 @@ async def vault_withdraw_cmd(
     amount: str,
     note: str | None = None
 ):
-    uid = resolve_character(character)
+    uid, key = resolve_with_key(character)
     if not uid:
-        await interaction.response.send_message(f"❌ No link for **{character}**.", ephemeral=True)
+        await interaction.response.send_message(_ERR_NO_LINK.format(character), ephemeral=True)
         return
 
-    key = normalize_display_name(character)
-
     try:
         m = Money.from_str(amount)
     except Exception:
         await interaction.response.send_message(
-            "❌ Amount format not recognized. Try `2g 5s`, `15s`, or `300k`.",
+            _ERR_AMOUNT_FORMAT,
             ephemeral=True
         )
         return
 
     if m.knuts <= 0:
-        await interaction.response.send_message("❌ Amount must be positive.", ephemeral=True)
+        await interaction.response.send_message(_ERR_AMOUNT_POSITIVE, ephemeral=True)
         return
 
     reason = note.strip() if (note and note.strip()) else "Staff Withdrawal"
 
-    ok = await withdraw_from_character(
+    ok, bal = await withdraw_from_character(
         interaction.guild,  # interaction_or_guild
         interaction.guild,  # guild
         uid,
@@ -883,7 +1297,6 @@ async def vault_withdraw_cmd(
         reason=reason
     )
     if not ok:
-        bal = get_balance(uid, key=key)
         await interaction.response.send_message(
             f"❌ Insufficient funds. {character} balance: **{bal.pretty_long()}**.",
             ephemeral=True
@@ -959,8 +1372,7 @@ async def hello_cmd(interaction: discord.Interaction):
 @bot.tree.command(name="balance", description="Show your linked characters and balances.")
 @app_commands.guilds(TEST_GUILD)
 async def balance_cmd(interaction: discord.Interaction):
-    links = all_links()  # {normalized_char_name: user_id}
-    my_chars = [char for char, uid in links.items() if uid == interaction.user.id]
+    my_chars = sorted(chars_for_user(interaction.user.id))
     if not my_chars:
         await interaction.response.send_message(
             "You have no linked characters yet. Use `/link_character` to link your Tupperbox name.",
@@ -968,10 +1380,11 @@ async def balance_cmd(interaction: discord.Interaction):
         )
         return
 
+    bals = get_balances(interaction.user.id, my_chars)
     total = Money(0)
     lines: list[str] = []
-    for char in sorted(my_chars):
-        bal = get_balance(interaction.user.id, key=char)
+    for char in my_chars:
+        bal = bals[char]
         total += bal
         lines.append(f"- **{char}** — {bal.pretty_long()}")
 
@@ -985,15 +1398,14 @@ async def balance_cmd(interaction: discord.Interaction):
 @app_commands.guilds(TEST_GUILD)
 @app_commands.describe(name="Character display name exactly as it appears on posts")
 async def char_balance_cmd(interaction: discord.Interaction, name: str):
-    uid = resolve_character(name)
+    uid, key = resolve_with_key(name)
     if not uid:
         await interaction.response.send_message(
             f"❌ I don’t have a link for **{name}**. Ask the player to run `/link_character`.",
             ephemeral=True
         )
         return
-    member = interaction.guild.get_member(uid) or await interaction.guild.fetch_member(uid)
-    key = normalize_display_name(name)
+    member = await resolve_member(interaction.guild, uid)
     bal = get_balance(uid, key=key)
     await interaction.response.send_message(
         f"**{name}** (played by {member.mention}) has **{bal.pretty_long()}**.",
@@ -1023,8 +1435,7 @@ async def link_character_cmd(interaction: discord.Interaction, name: str, user:
     granted_text = ""
     current = get_balance(target.id, key=key)
     if current.knuts == 0 and STARTER_FUNDS.knuts > 0:
-        add_balance(target.id, STARTER_FUNDS, key=key)
-        new_bal = get_balance(target.id, key=key)
+        new_bal = add_balance(target.id, STARTER_FUNDS, key=key)
         granted_text = f"\n💰 Starter funds added: **{STARTER_FUNDS.pretty_long()}** (New balance: **{new_bal.pretty_long()}**)."
         # Try to post a receipt in the character's vault if it exists
         try:
@@ -1035,7 +1446,7 @@ async def link_character_cmd(interaction: discord.Interaction, name: str, user:
                 reason="Starter funds for new character link"
             )
         except Exception as e:
-            logger.warning(f"post_receipt starter funds failed for {target.id}/{key}: {e}")
+            logger.warning("post_receipt starter funds failed for %s/%s: %s", target.id, key, e)
 
     await interaction.response.send_message(
         f"🔗 Linked **{name}** → {target.mention}. Proxied posts by **{name}** will now credit that wallet."
@@ -1059,12 +1470,32 @@ async def unlink_character_cmd(interaction: discord.Interaction, name: str):
 async def who_is_cmd(interaction: discord.Interaction, name: str):
     uid = resolve_character(name)
     if uid:
-        user = interaction.guild.get_member(uid) or await interaction.guild.fetch_member(uid)
+        user = await resolve_member(interaction.guild, uid)
         await interaction.response.send_message(f"**{name}** is linked to {user.mention}.", ephemeral=True)
     else:
         await interaction.response.send_message(f"**{name}** is not linked to anyone.", ephemeral=True)
 
 # Leaderboards
+async def _display_names(guild: discord.Guild, uids: list[int]) -> dict[int, str]:
+    """Display names for `uids`: cache hits first, then one gateway query for the rest."""
+    members = {uid: guild.get_member(uid) or _member_cache_get(guild.id, uid) for uid in uids}
+    missing = [uid for uid, m in members.items() if m is None]
+    if missing:
+        # One op-8 request for all of them instead of a fetch_member round-trip each;
+        # members who left simply don't come back and fall through to "User <id>"
+        try:
+            fetched = await guild.query_members(user_ids=missing, limit=len(missing), cache=True)
+        except (asyncio.TimeoutError, discord.ClientException) as e:
+            logger.warning("leaderboard:query_members_failed count=%s err=%s", len(missing), type(e).__name__)
+            fetched = []
+        for m in fetched:
+            members[m.id] = m
+            _member_cache_put(guild.id, m.id, m)
+    return {
+        uid: (m.display_name if m is not None else f"User {uid}")
+        for uid, m in members.items()
+    }
+
 @bot.tree.command(name="leaderboard", description="Top balances (user totals or character wallets).")
 @app_commands.guilds(TEST_GUILD)
 @app_commands.describe(scope="Choose 'users' for total per player or 'characters' for individual wallets")
@@ -1079,20 +1510,20 @@ async def leaderboard_cmd(interaction: discord.Interaction, scope: str = "users"
         if not top:
             await interaction.response.send_message("No balances yet.", ephemeral=True)
             return
+        names = await _display_names(interaction.guild, [uid for uid, _ in top])
         lines = []
         for rank, (uid, money) in enumerate(top, 1):
-            member = interaction.guild.get_member(uid) or await interaction.guild.fetch_member(uid)
-            lines.append(f"{rank}. {member.display_name} — {money.pretty_long()}")
+            lines.append(f"{rank}. {names[uid]} — {money.pretty_long()}")
         await interaction.response.send_message("**Top Players (total across characters)**\n" + "\n".join(lines))
     else:
         top = top_characters(10)
         if not top:
             await interaction.response.send_message("No character wallets yet.", ephemeral=True)
             return
+        names = await _display_names(interaction.guild, [uid for uid, _, _ in top])
         lines = []
         for rank, (uid, char_key, money) in enumerate(top, 1):
-            member = interaction.guild.get_member(uid) or await interaction.guild.fetch_member(uid)
-            lines.append(f"{rank}. {member.display_name} — **{char_key}** — {money.pretty_long()}")
+            lines.append(f"{rank}. {names[uid]} — **{char_key}** — {money.pretty_long()}")
         await interaction.response.send_message("**Top Characters (individual wallets)**\n" + "\n".join(lines))
 
 # Staff award (per-character)
@@ -1110,18 +1541,16 @@ async def award_character_cmd(
     amount: str,
     note: str | None = None
 ):
-    uid = resolve_character(character)
+    uid, key = resolve_with_key(character)
     if not uid:
-        await interaction.response.send_message(f"❌ No link for **{character}**.", ephemeral=True)
+        await interaction.response.send_message(_ERR_NO_LINK.format(character), ephemeral=True)
         return
 
-    key = normalize_display_name(character)
-
     try:
         money = Money.from_str(amount)
     except Exception:
         await interaction.response.send_message(
-            "❌ Amount format not recognized. Try `2g 5s`, `15s`, or `300k`.",
+            _ERR_AMOUNT_FORMAT,
             ephemeral=True
         )
         return
@@ -1147,78 +1576,78 @@ async def award_character_cmd(
 @app_commands.guilds(TEST_GUILD)
 @app_commands.describe(character="Character display name for this vault")
 async def vault_create_cmd(interaction: discord.Interaction, character: str):
-    uid = resolve_character(character)
-    if not uid:
-        await interaction.response.send_message(f"❌ No link for **{character}**.", ephemeral=True)
-        return
-    if uid != interaction.user.id and not interaction.user.guild_permissions.manage_guild:
-        await interaction.response.send_message("❌ You can only create a vault for your own character.", ephemeral=True)
-        return
-
-    key = normalize_display_name(character)
-
-    # Forum lookup
-    forum = interaction.guild.get_channel(GRINGOTTS_FORUM_ID) or await interaction.guild.fetch_channel(GRINGOTTS_FORUM_ID)
-    if not isinstance(forum, discord.ForumChannel):
-        await interaction.response.send_message("❌ GRINGOTTS_FORUM_ID is not a Forum channel.", ephemeral=True)
-        return
+    await interaction.response.defer(ephemeral=True, thinking=True)  # forum/thread fetches can outlast the 3s window
+    async with _followup_on_error(interaction, "vault_create"):
+        uid, key = resolve_with_key(character)
+        if not uid:
+            await interaction.followup.send(_ERR_NO_LINK.format(character), ephemeral=True)
+            return
+        if uid != interaction.user.id and not interaction.user.guild_permissions.manage_guild:
+            await interaction.followup.send("❌ You can only create a vault for your own character.", ephemeral=True)
+            return
 
-    # If already has a vault, short-circuit and show it (and its number)
-    from vaults import get_vault_info, set_vault_info, generate_vault_number
-    existing = get_vault_info(uid, key)
-    if existing:
-        try:
-            ch = await interaction.guild.fetch_channel(existing["thread_id"])
-        except discord.errors.NotFound:
-            await interaction.response.send_message(
-                f"⚠️ Vault record exists for **{character}** but the channel/thread was deleted. Creating a new vault...",
-                ephemeral=True
-            )
-        else:
-            await interaction.response.send_message(
-                f"🔗 Vault already exists for **{character}** — {ch.mention} (Vault **#{existing['vault_number']}**).",
-                ephemeral=True
-            )
+        # Forum lookup
+        forum = interaction.guild.get_channel(GRINGOTTS_FORUM_ID) or await interaction.guild.fetch_channel(GRINGOTTS_FORUM_ID)
+        if not isinstance(forum, discord.ForumChannel):
+            await interaction.followup.send("❌ GRINGOTTS_FORUM_ID is not a Forum channel.", ephemeral=True)
             return
 
-    # Create new vault number and thread
-    vault_number = generate_vault_number()
-    title = f"Gringotts Vault {vault_number} - {character}"
-    welcome_embed = discord.Embed(
-        title=f"Vault #{vault_number} — {character}",
-        description=(
-            f"🏦 Welcome, {character}, to your vault, courtesy of Gringotts Bank.\n\n"
-            f"Your Gringotts Vault Number: **{vault_number}**\n"
-            f"All deposits and withdrawals will be recorded here."
-        ),
-        color=discord.Color.gold()
-    )
-    welcome_embed.set_footer(text="Gringotts Wizarding Bank")
+        # If already has a vault, short-circuit and show it (and its number)
+        existing = get_vault_info(uid, key)
+        if existing:
+            try:
+                ch = (interaction.guild.get_channel_or_thread(existing["thread_id"])
+                      or await interaction.guild.fetch_channel(existing["thread_id"]))
+            except discord.errors.NotFound:
+                await interaction.followup.send(
+                    f"⚠️ Vault record exists for **{character}** but the channel/thread was deleted. Creating a new vault...",
+                    ephemeral=True
+                )
+            else:
+                await interaction.followup.send(
+                    f"🔗 Vault already exists for **{character}** — {ch.mention} (Vault **#{existing['vault_number']}**).",
+                    ephemeral=True
+                )
+                return
+
+        # Create new vault number and thread
+        vault_number = generate_vault_number()
+        title = f"Gringotts Vault {vault_number} - {character}"
+        welcome_embed = discord.Embed(
+            title=f"Vault #{vault_number} — {character}",
+            description=(
+                f"🏦 Welcome, {character}, to your vault, courtesy of Gringotts Bank.\n\n"
+                f"Your Gringotts Vault Number: **{vault_number}**\n"
+                f"All deposits and withdrawals will be recorded here."
+            ),
+            color=discord.Color.gold()
+        )
+        welcome_embed.set_footer(text="Gringotts Wizarding Bank")
 
-    created = await forum.create_thread(name=title, embed=welcome_embed)
-    thread_obj = created if hasattr(created, "id") else getattr(created, "thread", None)
+        created = await forum.create_thread(name=title, embed=welcome_embed)
+        thread_obj = created if hasattr(created, "id") else getattr(created, "thread", None)
 
-    if not thread_obj:
-        await interaction.response.send_message("❌ Unexpected response creating thread.", ephemeral=True)
-        return
+        if not thread_obj:
+            await interaction.followup.send("❌ Unexpected response creating thread.", ephemeral=True)
+            return
 
-    # Persist mapping (thread id + vault number)
-    set_vault_info(uid, key, thread_obj.id, vault_number)
+        # Persist mapping (thread id + vault number)
+        set_vault_info(uid, key, thread_obj.id, vault_number)
 
-    # Opening balance line
-    bal = get_balance(uid, key=key)
-    balance_embed = discord.Embed(
-        title="Opening Balance",
-        description=f"**{bal.pretty_long()}**",
-        color=discord.Color.green()
-    )
-    balance_embed.set_footer(text="Gringotts Ledger Entry")
-    await thread_obj.send(embed=balance_embed)
+        # Opening balance line
+        bal = get_balance(uid, key=key)
+        balance_embed = discord.Embed(
+            title="Opening Balance",
+            description=f"**{bal.pretty_long()}**",
+            color=discord.Color.green()
+        )
+        balance_embed.set_footer(text="Gringotts Ledger Entry")
+        await thread_obj.send(embed=balance_embed)
 
-    await interaction.response.send_message(
-        f"🏦 Vault created: {thread_obj.mention} (Vault **{vault_number}**)",
-        ephemeral=True
-    )
+        await interaction.followup.send(
+            f"🏦 Vault created: {thread_obj.mention} (Vault **{vault_number}**)",
+            ephemeral=True
+        )
 
 # Link a Vault
 @bot.tree.command(name="vault_link", description="Link an existing Gringotts forum thread to a character. Auto-generates a vault # if needed.")
@@ -1228,70 +1657,70 @@ async def vault_create_cmd(interaction: discord.Interaction, character: str):
     thread_id="Forum thread ID (copy link; the big number at the end)"
 )
 async def vault_link_cmd(interaction: discord.Interaction, character: str, thread_id: str):
-    uid = resolve_character(character)
-    if not uid:
-        await interaction.response.send_message(f"❌ No link for **{character}**.", ephemeral=True)
-        return
-    if uid != interaction.user.id and not interaction.user.guild_permissions.manage_guild:
-        await interaction.response.send_message("❌ You can only link a vault for your own character.", ephemeral=True)
-        return
-
-    key = normalize_display_name(character)
+    await interaction.response.defer(ephemeral=True, thinking=True)  # forum/thread fetches can outlast the 3s window
+    async with _followup_on_error(interaction, "vault_link"):
+        uid, key = resolve_with_key(character)
+        if not uid:
+            await interaction.followup.send(_ERR_NO_LINK.format(character), ephemeral=True)
+            return
+        if uid != interaction.user.id and not interaction.user.guild_permissions.manage_guild:
+            await interaction.followup.send("❌ You can only link a vault for your own character.", ephemeral=True)
+            return
 
-    # Parse the thread id
-    try:
-        tid = int(thread_id)
-    except ValueError:
-        await interaction.response.send_message("❌ `thread_id` must be a number.", ephemeral=True)
-        return
+        # Parse the thread id
+        raw_tid = thread_id.strip()
+        if not (raw_tid.isascii() and raw_tid.isdigit()):  # isdigit alone admits e.g. '²', which int() rejects
+            await interaction.followup.send("❌ `thread_id` must be a number.", ephemeral=True)
+            return
+        tid = int(raw_tid)
 
-    # Fetch and validate the channel
-    try:
-        ch = await interaction.guild.fetch_channel(tid)
-    except Exception:
-        await interaction.response.send_message("❌ That thread ID doesn't exist in this server.", ephemeral=True)
-        return
+        # Fetch and validate the channel (guild cache first; archived threads need the REST call)
+        ch = interaction.guild.get_channel_or_thread(tid)
+        if ch is None:
+            try:
+                ch = await interaction.guild.fetch_channel(tid)
+            except Exception:
+                await interaction.followup.send("❌ That thread ID doesn't exist in this server.", ephemeral=True)
+                return
 
-    # Must be a thread (forum post = PublicThread)
-    if not isinstance(ch, (discord.Thread,)):
-        await interaction.response.send_message("❌ That ID is not a thread. Please supply a forum thread ID.", ephemeral=True)
-        return
+        # Must be a thread (forum post = PublicThread)
+        if not isinstance(ch, (discord.Thread,)):
+            await interaction.followup.send("❌ That ID is not a thread. Please supply a forum thread ID.", ephemeral=True)
+            return
 
-    # Optional: ensure it’s inside the Gringotts forum
-    if ch.parent_id != GRINGOTTS_FORUM_ID:
-        await interaction.response.send_message(
-            "⚠️ That thread isn’t in the configured Gringotts forum. Link anyway? (Ask staff to move it.)",
-            ephemeral=True
-        )
+        # Optional: ensure it’s inside the Gringotts forum
+        if ch.parent_id != GRINGOTTS_FORUM_ID:
+            await interaction.followup.send(
+                "⚠️ That thread isn’t in the configured Gringotts forum. Link anyway? (Ask staff to move it.)",
+                ephemeral=True
+            )
 
-    # Persist mapping (reuse existing number, or auto-generate)
-    from vaults import get_vault_info, set_vault_info, generate_vault_number
-    existing = get_vault_info(uid, key)
-    if existing and existing.get("vault_number"):
-        vault_number = existing["vault_number"]
-    else:
-        vault_number = generate_vault_number()
+        # Persist mapping (reuse existing number, or auto-generate)
+        existing = get_vault_info(uid, key)
+        if existing and existing.get("vault_number"):
+            vault_number = existing["vault_number"]
+        else:
+            vault_number = generate_vault_number()
 
-    set_vault_info(uid, key, ch.id, vault_number)
+        set_vault_info(uid, key, ch.id, vault_number)
 
-    await interaction.response.send_message(
-        f"🔗 Linked **{character}** to {ch.mention}. Vault **#{vault_number}**.",
-        ephemeral=True
-    )
+        await interaction.followup.send(
+            f"🔗 Linked **{character}** to {ch.mention}. Vault **#{vault_number}**.",
+            ephemeral=True
+        )
 
 # Unlink a Vault
 @bot.tree.command(name="vault_unlink", description="Unlink the vault thread from a character.")
 @app_commands.guilds(TEST_GUILD)
 @app_commands.describe(character="Character display name")
 async def vault_unlink_cmd(interaction: discord.Interaction, character: str):
-    uid = resolve_character(character)
+    uid, key = resolve_with_key(character)
     if not uid:
-        await interaction.response.send_message(f"❌ No link for **{character}**.", ephemeral=True)
+        await interaction.response.send_message(_ERR_NO_LINK.format(character), ephemeral=True)
         return
     if uid != interaction.user.id and not interaction.user.guild_permissions.manage_guild:
         await interaction.response.send_message("❌ You can only unlink your own character's vault.", ephemeral=True)
         return
-    key = normalize_display_name(character)
     ok = unlink_vault_thread(uid, key)
     await interaction.response.send_message("🧹 Unlinked." if ok else "Nothing was linked.", ephemeral=True)
 
@@ -1303,42 +1732,56 @@ async def vault_unlink_cmd(interaction: discord.Interaction, character: str):
     amount="e.g., 10s or 2g"
 )
 async def tip_cmd(interaction: discord.Interaction, from_character: str, to_character: str, amount: str):
-    from_uid = resolve_character(from_character)
-    to_uid = resolve_character(to_character)
+    from_uid, from_key = resolve_with_key(from_character)
+    to_uid, to_key = resolve_with_key(to_character)
     if not from_uid:
-        await interaction.response.send_message(f"❌ No link for **{from_character}**.", ephemeral=True)
+        await interaction.response.send_message(_ERR_NO_LINK.format(from_character), ephemeral=True)
         return
     if not to_uid:
-        await interaction.response.send_message(f"❌ No link for **{to_character}**.", ephemeral=True)
+        await interaction.response.send_message(_ERR_NO_LINK.format(to_character), ephemeral=True)
         return
     if from_uid != interaction.user.id:
         await interaction.response.send_message("❌ You can only send from your own character.", ephemeral=True)
         return
 
-    from_key = normalize_display_name(from_character)
-    to_key   = normalize_display_name(to_character)
-
     try:
         m = Money.from_str(amount)
     except Exception:
-        await interaction.response.send_message("❌ Amount format not recognized. Try `2g 5s`, `15s`, or `300k`.", ephemeral=True)
+        await interaction.response.send_message(_ERR_AMOUNT_FORMAT, ephemeral=True)
         return
     if m.knuts <= 0:
-        await interaction.response.send_message("❌ Amount must be positive.", ephemeral=True)
+        await interaction.response.send_message(_ERR_AMOUNT_POSITIVE, ephemeral=True)
         return
 
-    ok = await withdraw_from_character(interaction.guild, interaction.guild, from_uid, from_key, m, reason=f"Tip to {to_character}")
+    if (from_uid, from_key) == (to_uid, to_key):
+        await interaction.response.send_message("❌ A character can't tip themselves.", ephemeral=True)
+        return
+
+    # Debit and credit in one bank transaction (single lock, single log flush);
+    # no I/O yet, so a refusal can still be an immediate ephemeral reply
+    ok, from_bal, to_bal = try_transfer(from_uid, to_uid, m, from_key=from_key, to_key=to_key)
     if not ok:
-        bal = get_balance(from_uid, key=from_key)
         await interaction.response.send_message(
-            f"❌ {from_character} lacks funds. Balance **{bal.pretty_long()}**.", ephemeral=True
+            f"❌ {from_character} lacks funds. Balance **{from_bal.pretty_long()}**.", ephemeral=True
         )
         return
 
-    await deposit_to_character(interaction.guild, interaction.guild, to_uid, to_key, m, reason=f"Tip from {from_character}")
-    to_member = interaction.guild.get_member(to_uid) or await interaction.guild.fetch_member(to_uid)
-    await interaction.response.send_message(
-        f"🤝 **{from_character}** sent **{m.pretty_long()}** to **{to_character}** ({to_member.mention})."
+    # Receipts and the member lookup hit the API; defer so we aren't bound by the 3s window.
+    # The money has already moved, so their failures are logged and the reply always goes out.
+    await interaction.response.defer(thinking=True)
+    guild = interaction.guild
+    sent_receipt, got_receipt, to_member = await asyncio.gather(
+        post_receipt(bot, guild, from_uid, from_key, Money(-m.knuts), from_bal, f"Tip to {to_character}"),
+        post_receipt(bot, guild, to_uid, to_key, m, to_bal, f"Tip from {from_character}"),
+        resolve_member(guild, to_uid),
+        return_exceptions=True,
+    )
+    for what, res in (("sender_receipt", sent_receipt), ("receiver_receipt", got_receipt), ("member", to_member)):
+        if isinstance(res, BaseException):
+            logger.warning("tip:%s_failed from_uid=%s to_uid=%s err=%r", what, from_uid, to_uid, res)
+    to_mention = f"<@{to_uid}>" if isinstance(to_member, BaseException) else to_member.mention
+    await interaction.followup.send(
+        f"🤝 **{from_character}** sent **{m.pretty_long()}** to **{to_character}** ({to_mention})."
     )
 
 # ---------------- HELP (slash) ----------------
@@ -1401,25 +1844,28 @@ def _help_embed_vault() -> discord.Embed:
     )
     return e
 
+# Static content: build once, reuse on every /help. Section value -> embeds to send.
+_HELP_LINKING = _help_embed_linking()
+_HELP_VAULT = _help_embed_vault()
+_HELP_DISPATCH: dict[str, list[discord.Embed]] = {
+    "all": [_HELP_LINKING, _HELP_VAULT],
+    "linking": [_HELP_LINKING],
+    "vault": [_HELP_VAULT],
+}
+
 @bot.tree.command(name="help", description="How to use the bot (linking & vault).")
 @app_commands.guilds(TEST_GUILD)
 @app_commands.describe(section="Pick a section or 'All'")
 @app_commands.choices(section=HELP_CHOICES)
 async def help_cmd(interaction: discord.Interaction, section: app_commands.Choice[str] | None = None):
     sel = (section.value if section else "all").lower()
-    embeds: list[discord.Embed] = []
-    if sel in ("all", "linking"):
-        embeds.append(_help_embed_linking())
-    if sel in ("all", "vault"):
-        embeds.append(_help_embed_vault())
-
+    embeds = _HELP_DISPATCH.get(sel)
     if not embeds:
         await interaction.response.send_message("No help available.", ephemeral=True)
         return
 
-    await interaction.response.send_message(embed=embeds[0], ephemeral=True)
-    for e in embeds[1:]:
-        await interaction.followup.send(embed=e, ephemeral=True)
+    # One message carries all sections (Discord allows up to 10 embeds)
+    await interaction.response.send_message(embeds=embeds, ephemeral=True)
 
 # ---------------- WEEKLY PAYDAY ----------------
 # NOTE: These constants must exist somewhere in your codebase or env. If not, define them or remove payday.
@@ -1427,80 +1873,159 @@ ADULT_ROLE_NAME = os.getenv("ADULT_ROLE_NAME", "Adult")  # placeholder default
 BASE_WEEKLY_PAY = Money.from_str(os.getenv("BASE_WEEKLY_PAY", "0k"))
 JOB_BONUSES = {}  # role name -> Money
 
+def _payday_roles(guild: discord.Guild) -> tuple[int | None, dict[int, int]]:
+    """Resolve the configured role names to ids for this guild: (adult_role_id, {role_id: bonus_knuts})."""
+    adult_id = None
+    bonus_by_id: dict[int, int] = {}
+    for role in guild.roles:
+        if role.name == ADULT_ROLE_NAME and adult_id is None:
+            adult_id = role.id
+        bonus = JOB_BONUSES.get(role.name)
+        if bonus:
+            bonus_by_id[role.id] = bonus.knuts
+    return adult_id, bonus_by_id
+
+PAYDAY_DM_CONCURRENCY = 10
+
+async def _run_workers(jobs: Iterable[tuple], handler, workers: int) -> int:
+    """
+    Feed `jobs` through a bounded queue to a fixed pool of `workers` tasks, each
+    awaiting handler(*job). One stalled API call only holds up its own worker, and
+    the queue bound keeps memory flat however many jobs the producer yields.
+    Returns how many handler calls returned True; exceptions are logged per job.
+    """
+    q: asyncio.Queue = asyncio.Queue(maxsize=workers * 32)
+    ok_count = 0
+
+    async def worker() -> None:
+        nonlocal ok_count
+        while (job := await q.get()) is not None:
+            try:
+                if await handler(*job) is True:
+                    ok_count += 1
+            except Exception:
+                logger.exception("worker:job_failed handler=%s", handler.__name__)
+
+    pool = [asyncio.create_task(worker()) for _ in range(workers)]
+    try:
+        for job in jobs:
+            await q.put(job)
+        for _ in pool:
+            await q.put(None)
+        await asyncio.gather(*pool)
+    finally:
+        for t in pool:
+            t.cancel()
+    return ok_count
+
+async def _payday_dm(member: discord.Member, pay: Money) -> None:
+    try:
+        await member.send(f"💰 Payday! You received **{pay.pretty_long()}**.")
+    except discord.Forbidden:
+        pass
+
 @tasks.loop(hours=168)  # weekly
 async def weekly_payday():
+    base_knuts = BASE_WEEKLY_PAY.knuts
     for guild in bot.guilds:
+        adult_id, bonus_by_id = _payday_roles(guild)
+        paid = []  # (member, pay)
         for member in guild.members:
             if member.bot:
                 continue
-            pay = Money(0)
-            if discord.utils.get(member.roles, name=ADULT_ROLE_NAME):
-                pay += BASE_WEEKLY_PAY
-            for role in member.roles:
-                bonus = JOB_BONUSES.get(role.name)
-                if bonus:
-                    pay += bonus
+            # member.get_role is a binary search over the member's role ids;
+            # member.roles would build and sort Role objects every time.
+            knuts = 0
+            if adult_id is not None and member.get_role(adult_id):
+                knuts += base_knuts
+            for rid, bonus_knuts in bonus_by_id.items():
+                if member.get_role(rid):
+                    knuts += bonus_knuts
+            pay = Money(knuts)
             if pay.knuts > 0:
-                add_balance(member.id, pay)
-                try:
-                    await member.send(f"💰 Payday! You received **{pay.pretty_long()}**.")
-                except discord.Forbidden:
-                    pass
+                paid.append((member, pay))
+        if not paid:
+            continue
+        # One bank write for the whole guild
+        batch_update([("add", (member.id, pay)) for member, pay in paid])
+        await _run_workers(paid, _payday_dm, PAYDAY_DM_CONCURRENCY)
+
+@tasks.loop(seconds=2.0)
+async def flush_pending_receipts():
+    await _pending_flush_async()
 
 @tasks.loop(time=datetime.time(hour=0, minute=5, tzinfo=datetime.timezone.utc))
 async def flush_daily_receipts():
     """
-    Post one summary receipt per character for yesterday's RP earnings (UTC).
+    Post one summary receipt per character for each finished day's RP earnings (UTC).
+    Normally that's just yesterday; days missed while the bot was down are caught
+    up too, so old buckets never pile up in pending_receipts.json.
     """
-    now_utc = datetime.datetime.now(datetime.timezone.utc)
-    prev_day = (now_utc - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-
-    data = _pending_load()
-    day_bucket = data.get(prev_day)
-    if not day_bucket:
-        logger.debug(f"flush:no_data_for_day day={prev_day}")
+    today = _utc_datestr()
+    due = sorted(day for day in _pending_mem if day < today)
+    if not due:
+        logger.debug("flush:no_data_before day=%s", today)
         return
 
-    flush_count = 0
+    global _pending_dirty
+    for day in due:
+        flush_count = await _flush_receipts_for_day(day)
+        _pending_mem.pop(day, None)
+        _pending_dirty = True
+        logger.info("flush:completed day=%s posted_receipts=%s", day, flush_count)
+    await _pending_flush_async()
+
+RECEIPT_FLUSH_CONCURRENCY = 8  # concurrent receipt posts; discord.py handles per-route rate limits
+
+async def _post_daily_receipt(guild: discord.Guild, user_id: int, char_key: str,
+                              total_knuts: int, msg_count: int, day: str) -> bool:
+    delta = Money(knuts=total_knuts)
+    new_bal = get_balance(user_id, key=char_key)
+    reason = f"Daily RP earnings ({msg_count} message{'s' if msg_count != 1 else ''}) for {day} UTC"
+    try:
+        await post_receipt(bot, guild, user_id, char_key, delta, new_bal, reason=reason)
+        return True
+    except Exception:
+        logger.exception(
+            "flush:post_receipt_failed user_id=%s char_key='%s' guild_id=%s day=%s delta_knuts=%s",
+            user_id, char_key, guild.id, day, total_knuts
+        )
+        return False
 
-    for gkey, entries in day_bucket.items():
+def _daily_receipt_jobs(day: str):
+    """Yield _post_daily_receipt args for every valid entry queued for `day`."""
+    for gkey, entries in (_pending_mem.get(day) or {}).items():
         guild_id = int(gkey)
-        guild = discord.utils.get(bot.guilds, id=guild_id)
+        guild = bot.get_guild(guild_id)  # dict lookup in the client cache
         if not guild:
-            logger.warning(f"flush:missing_guild guild_id={guild_id} day={prev_day}")
+            logger.warning("flush:missing_guild guild_id=%s day=%s", guild_id, day)
             continue
 
         for uck, rec in entries.items():
             try:
                 uid_str, char_key = uck.split(":", 1)
             except ValueError:
-                logger.warning(f"flush:bad_key uck='{uck}' day={prev_day}")
+                logger.warning("flush:bad_key uck='%s' day=%s", uck, day)
                 continue
             user_id = int(uid_str)
-            total_knuts = int(rec.get("knuts", 0))
-            msg_count = int(rec.get("count", 0))
+            total_knuts, msg_count = rec
             if total_knuts <= 0 or msg_count <= 0:
-                logger.debug(f"flush:zero_totals user_id={user_id} char_key='{char_key}' day={prev_day}")
+                logger.debug("flush:zero_totals user_id=%s char_key='%s' day=%s", user_id, char_key, day)
                 continue
+            yield (guild, user_id, char_key, total_knuts, msg_count, day)
 
-            delta = Money(knuts=total_knuts)
-            new_bal = get_balance(user_id, key=char_key)
-            reason = f"Daily RP earnings ({msg_count} message{'s' if msg_count != 1 else ''}) for {prev_day} UTC"
-
-            try:
-                await post_receipt(bot, guild, user_id, char_key, delta, new_bal, reason=reason)
-                flush_count += 1
-            except Exception:
-                logger.exception(
-                    f"flush:post_receipt_failed user_id={user_id} char_key='{char_key}' "
-                    f"guild_id={guild_id} day={prev_day} delta_knuts={total_knuts}"
-                )
-
-    data.pop(prev_day, None)
-    _pending_save_atomic(data)
-    logger.info(f"flush:completed day={prev_day} posted_receipts={flush_count}")
+async def _flush_receipts_for_day(day: str) -> int:
+    """Post the receipts queued for `day`. Returns how many were posted."""
+    return await _run_workers(_daily_receipt_jobs(day), _post_daily_receipt, RECEIPT_FLUSH_CONCURRENCY)
 
 # ---------------- RUN ----------------
+def _on_sigterm(signum, frame) -> None:
+    # The default SIGTERM action skips atexit; exit normally so the bank and
+    # pending-receipt flushes still run.
+    raise SystemExit(128 + signum)
+
 if __name__ == "__main__":
     logger.info("Starting bot process...")
+    start_bank()
+    signal.signal(signal.SIGTERM, _on_sigterm)
     bot.run(TOKEN)
\ No newline at end of file
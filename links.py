@@ -12,6 +12,8 @@ Features
 - Splits on common separators (|, —, " - ", •, ·, –) and keeps the left side
 - Keeps only letters/digits/space/'/- and collapses whitespace
 - Thread-safe JSON storage with atomic writes
+- Resident in-memory map (reloaded only if the file changes underneath us)
+- Reverse index user_id -> character keys (built on load, never persisted)
 - Aliases: map multiple display variants to the same user
 """
 
@@ -19,12 +21,16 @@ from __future__ import annotations
 import json
 import os
 import re
+import sys
 import threading
 import tempfile
 import unicodedata
-from typing import Dict, Optional
+from functools import lru_cache
+from typing import Dict, Optional, Set
 import logging
 
+from storage import UNLOADED, file_sig
+
 # Child logger that flows into the parent "gringotts" logger configured in bot.py
 logger = logging.getLogger("gringotts.links")
 
@@ -36,6 +42,7 @@ DB_FILE = os.path.join(DATA_DIR, "character_links.json")
 _lock = threading.Lock()
 
 # ---------- Normalization helpers ----------
+@lru_cache(maxsize=4096)
 def _nfkc_lower(s: str) -> str:
     """Base normalize + lowercase + trim."""
     return unicodedata.normalize("NFKC", (s or "")).lower().strip()
@@ -64,17 +71,27 @@ _EMOJI_RE = re.compile(
     flags=re.UNICODE,
 )
 
-def _strip_variations_and_zwj(s: str) -> str:
-    """Remove Variation Selectors and Zero-Width Joiner."""
-    return s.replace("\u200d", "").replace("\ufe0e", "").replace("\ufe0f", "")
+class _MarkTable(dict):
+    """
+    str.translate table that deletes ZWJ and every combining mark (Mn, which
+    includes the variation selectors). Filled lazily: each code point is
+    classified once, after which translate() stays in C.
+    """
+    def __missing__(self, cp: int):
+        out = None if unicodedata.category(chr(cp)) == "Mn" else cp
+        self[cp] = out
+        return out
+
+_MARK_TABLE = _MarkTable({0x200D: None})
 
-def _strip_combining(s: str) -> str:
-    """Remove combining marks (accent overlays etc.)."""
-    return "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
+def _strip_marks(s: str) -> str:
+    """Remove Variation Selectors, Zero-Width Joiner and combining marks (accent overlays etc.)."""
+    return s.translate(_MARK_TABLE)
 
+@lru_cache(maxsize=4096)
 def normalize_display_name(name: str) -> str:
     """
-    Smart normalizer for Tupperbox names:
+    Smart normalizer for Tupperbox names (memoized; the same proxy names repeat constantly):
     - NFKC fold, lowercase, trim
     - drop VS/ZWJ, combining marks
     - remove emoji/pictographs
@@ -83,10 +100,13 @@ def normalize_display_name(name: str) -> str:
     - keep only letters/digits/space/'/-, collapse spaces
     """
     raw = name or ""
-    s = _nfkc_lower(raw)
-    s = _strip_variations_and_zwj(s)
-    s = _strip_combining(s)
-    s = _EMOJI_RE.sub("", s)
+    if raw.isascii():
+        # NFKC, VS/ZWJ, combining marks and emoji are all no-ops on ASCII
+        s = raw.lower().strip()
+    else:
+        s = _nfkc_lower(raw)
+        s = _strip_marks(s)
+        s = _EMOJI_RE.sub("", s)
 
     # Strip trailing bracketed decorations repeatedly
     while True:
@@ -104,6 +124,9 @@ def normalize_display_name(name: str) -> str:
     s = re.sub(r"[^a-z0-9\s'\-]", " ", s)
     # Collapse whitespace
     s = re.sub(r"\s+", " ", s).strip()
+    # Interned: every display variant of a character yields the same key object,
+    # so cooldown/bank/pending dict lookups on it hit the identity fast path.
+    s = sys.intern(s)
 
     if logger.isEnabledFor(logging.DEBUG):
         logger.debug(f"normalize: raw='{raw}' -> key='{s}'")
@@ -162,8 +185,8 @@ def _load() -> Dict[str, int]:
         logger.debug(f"load:ok count={len(out)}")
     return out
 
-def _atomic_write(data: Dict[str, int]) -> None:
-    """Write JSON atomically to avoid partial/corrupt files."""
+def _atomic_write(data: Dict[str, int]) -> bool:
+    """Write JSON atomically to avoid partial/corrupt files. Returns True on success."""
     dir_ = os.path.dirname(DB_FILE) or "."
     try:
         with tempfile.NamedTemporaryFile("w", delete=False, dir=dir_, encoding="utf-8") as tmp:
@@ -172,6 +195,7 @@ def _atomic_write(data: Dict[str, int]) -> None:
         os.replace(tmp_path, DB_FILE)
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug(f"save:ok path='{DB_FILE}' count={len(data)}")
+        return True
     except Exception as e:
         logger.exception(f"save:error path='{DB_FILE}': {e}")
         # Best-effort cleanup for temp file if it still exists
@@ -180,17 +204,60 @@ def _atomic_write(data: Dict[str, int]) -> None:
                 os.remove(tmp_path)
         except Exception:
             pass
+        return False
 
 def _save(data: Dict[str, int]) -> None:
-    _atomic_write(data)
+    global _links_sig
+    # On failure the resident map holds an edit the file doesn't; force a reload
+    _links_sig = file_sig(DB_FILE) if _atomic_write(data) else UNLOADED
+
+# ---------- Resident map ----------
+# {normalized_name: user_id}, mirrored from DB_FILE. _links_sig is the file
+# signature it was loaded at; a hand edit to the file triggers a reload.
+_links: Dict[str, int] = {}
+_links_sig: object = UNLOADED
+# {user_id: {normalized_name, ...}}: the reverse of _links, rebuilt whenever it reloads
+_links_by_user: Dict[int, Set[str]] = {}
+
+def _index_add(key: str, uid: int) -> None:
+    _links_by_user.setdefault(uid, set()).add(key)
+
+def _index_discard(key: str, uid: int) -> None:
+    keys = _links_by_user.get(uid)
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            del _links_by_user[uid]
+
+def _links_locked() -> Dict[str, int]:
+    """The resident map, reloaded if DB_FILE changed. Caller holds _lock."""
+    global _links, _links_sig, _links_by_user
+    sig = file_sig(DB_FILE)
+    if sig != _links_sig:
+        _links = _load()
+        _links_sig = sig
+        _links_by_user = {}
+        for key, uid in _links.items():
+            _index_add(key, uid)
+    return _links
+
+def _links_view() -> Dict[str, int]:
+    """Read-only access to the resident map; only takes the lock when a reload is needed."""
+    if file_sig(DB_FILE) != _links_sig:
+        with _lock:
+            return _links_locked()
+    return _links
 
 # ---------- Public API ----------
 def link_character(name: str, user_id: int) -> None:
     key = _normalize_or_fail(name)
     with _lock:
-        data = _load()
+        data = _links_locked()
         old = data.get(key)
         data[key] = int(user_id)
+        if old is not None:
+            _index_discard(key, old)
+        _index_add(key, int(user_id))
         _save(data)
     if old is None:
         logger.info(f"link:set key='{key}' user_id={user_id}")
@@ -202,9 +269,12 @@ def link_character(name: str, user_id: int) -> None:
 def link_alias(alias_name: str, user_id: int) -> None:
     key = _normalize_or_fail(alias_name)
     with _lock:
-        data = _load()
+        data = _links_locked()
         old = data.get(key)
         data[key] = int(user_id)
+        if old is not None:
+            _index_discard(key, old)
+        _index_add(key, int(user_id))
         _save(data)
     if old is None:
         logger.info(f"alias:set key='{key}' user_id={user_id}")
@@ -218,11 +288,11 @@ def unlink_character(name: str) -> bool:
     candidates = _norm_variants(name)
     removed: list[str] = []
     with _lock:
-        data = _load()
+        data = _links_locked()
         for k in candidates:
             if k in data:
                 removed.append(k)
-                data.pop(k, None)
+                _index_discard(k, data.pop(k))
         if removed:
             _save(data)
     if removed:
@@ -233,17 +303,26 @@ def unlink_character(name: str) -> bool:
         return False
 
 def resolve_character(name: str) -> Optional[int]:
+    """Map a display name to its linked user id (strict key first, then the soft NFKC one)."""
+    return resolve_with_key(name)[0]
+
+def resolve_with_key(name: str) -> tuple[Optional[int], str]:
+    """
+    Like resolve_character, but also returns the strict normalized key
+    (the balance key for this character), so hot paths normalize once.
+    """
     strict = normalize_display_name(name)
     soft = _nfkc_lower(name)
-    with _lock:
-        data = _load()
+    data = _links_view()
     for k in (strict, soft):
         if k and k in data:
-            uid = int(data[k])
-            logger.debug(f"resolve:hit key='{k}' user_id={uid} (strict='{strict}', soft='{soft}')")
-            return uid
-    logger.debug(f"resolve:miss strict='{strict}' soft='{soft}'")
-    return None
+            uid = data[k]
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"resolve:hit key='{k}' user_id={uid} (strict='{strict}', soft='{soft}')")
+            return uid, strict
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"resolve:miss strict='{strict}' soft='{soft}'")
+    return None, strict
 
 def all_links() -> Dict[str, int]:
     """
@@ -251,14 +330,19 @@ def all_links() -> Dict[str, int]:
     Keys are smart-normalized display names.
     """
     with _lock:
-        data = _load()
+        out = dict(_links_locked())
     if logger.isEnabledFor(logging.DEBUG):
-        logger.debug(f"all_links:count={len(data)}")
-    return dict(data)
+        logger.debug(f"all_links:count={len(out)}")
+    return out
+
+def chars_for_user(user_id: int) -> Set[str]:
+    """Character keys linked to user_id (a copy; O(k) in that user's links, not all links)."""
+    with _lock:
+        _links_locked()
+        return set(_links_by_user.get(int(user_id), ()))
 
 # ---------- Optional: debugging helper ----------
 def debug_dump() -> str:
     """Return a human-readable dump of all links (one per line)."""
-    with _lock:
-        data = _load()
+    data = all_links()
     return "\n".join(f"{name} -> {uid}" for name, uid in sorted(data.items()))
@@ -0,0 +1,22 @@
+# storage.py
+"""
+Helpers shared by the JSON-backed stores (bank, links, vaults, shops).
+Each keeps a resident copy of its file and reloads it only when the file's
+signature changes, e.g. after a hand edit.
+"""
+
+from __future__ import annotations
+import os
+from typing import Optional, Tuple
+
+# Signature of a copy that was never loaded. It differs from every file_sig()
+# result, including None for a missing file, so the first access always loads.
+UNLOADED: object = ()
+
+def file_sig(path: str) -> Optional[Tuple[int, int]]:
+    """(mtime_ns, size) of `path`, or None if it doesn't exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
@@ -4,6 +4,7 @@ import os, json, tempfile, random, threading
 from typing import Optional, Dict
 import discord
 from currency import Money
+from storage import UNLOADED, file_sig
 import logging
 
 # Child logger (parent configured in bot.py)
@@ -35,7 +36,7 @@ def _load() -> dict:
         logger.exception(f"load:error file='{VAULTS_FILE}': {e}")
         return {}
 
-def _save_atomic(data: dict) -> None:
+def _save_atomic(data: dict) -> bool:
     d = os.path.dirname(VAULTS_FILE) or "."
     try:
         with tempfile.NamedTemporaryFile("w", delete=False, dir=d, encoding="utf-8") as tmp:
@@ -44,6 +45,7 @@ def _save_atomic(data: dict) -> None:
         os.replace(tmp_path, VAULTS_FILE)
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug(f"save:ok path='{VAULTS_FILE}' keys={len(data)}")
+        return True
     except Exception as e:
         logger.exception(f"save:error path='{VAULTS_FILE}': {e}")
         try:
@@ -51,6 +53,28 @@ def _save_atomic(data: dict) -> None:
                 os.remove(tmp_path)
         except Exception:
             pass
+        return False
+
+# ---------------- Resident copy ----------------
+# vaults.json mirrored in memory; reloaded only if the file's signature changes
+# (e.g. a hand edit), so receipts and lookups never touch the disk.
+_vaults: dict = {}
+_vaults_sig: object = UNLOADED
+
+def _data_locked() -> dict:
+    """The resident mapping, reloaded if VAULTS_FILE changed. Caller holds _lock."""
+    global _vaults, _vaults_sig
+    sig = file_sig(VAULTS_FILE)
+    if sig != _vaults_sig:
+        _vaults = _load()
+        _vaults_sig = sig
+    return _vaults
+
+def _commit_locked(data: dict) -> None:
+    """Persist the resident mapping after a mutation. Caller holds _lock."""
+    global _vaults_sig
+    # On failure the resident copy holds an edit the file doesn't; force a reload
+    _vaults_sig = file_sig(VAULTS_FILE) if _save_atomic(data) else UNLOADED
 
 # ---------------- Helpers ----------------
 def _key(user_id: int) -> str:
@@ -68,9 +92,8 @@ def get_vault_info(user_id: int, char_key: str) -> Optional[Dict]:
     """
     Returns a dict with {"thread_id": int, "vault_number": str} or None.
     """
-    data = _load()
-    u = data.get(_key(user_id), {})
-    info = u.get(char_key)
+    with _lock:
+        info = _data_locked().get(_key(user_id), {}).get(char_key)
     if isinstance(info, dict) and "thread_id" in info and "vault_number" in info:
         out = {"thread_id": int(info["thread_id"]), "vault_number": str(info["vault_number"])}
         if logger.isEnabledFor(logging.DEBUG):
@@ -89,11 +112,12 @@ def get_vault_number(user_id: int, char_key: str) -> Optional[str]:
     return info["vault_number"] if info else None
 
 def set_vault_info(user_id: int, char_key: str, thread_id: int, vault_number: str) -> None:
-    data = _load()
-    u = _ensure_user(data, user_id)
-    prev = u.get(char_key)
-    u[char_key] = {"thread_id": int(thread_id), "vault_number": str(vault_number)}
-    _save_atomic(data)
+    with _lock:
+        data = _data_locked()
+        u = _ensure_user(data, user_id)
+        prev = u.get(char_key)
+        u[char_key] = {"thread_id": int(thread_id), "vault_number": str(vault_number)}
+        _commit_locked(data)
     if prev is None:
         logger.info(f"vault:set user_id={user_id} char_key='{char_key}' thread_id={thread_id} vault='{vault_number}'")
     else:
@@ -103,24 +127,27 @@ def set_vault_thread(user_id: int, char_key: str, thread_id: int) -> None:
     """
     Backward-compat: if called without a number, preserve existing number or create one.
     """
-    data = _load()
-    u = _ensure_user(data, user_id)
-    existing = u.get(char_key) or {}
-    vn = str(existing.get("vault_number") or generate_vault_number())
-    u[char_key] = {"thread_id": int(thread_id), "vault_number": vn}
-    _save_atomic(data)
+    with _lock:
+        data = _data_locked()
+        u = _ensure_user(data, user_id)
+        existing = u.get(char_key) or {}
+        vn = str(existing.get("vault_number") or generate_vault_number())
+        u[char_key] = {"thread_id": int(thread_id), "vault_number": vn}
+        _commit_locked(data)
     if existing:
         logger.info(f"vault:link_thread user_id={user_id} char_key='{char_key}' thread_id={thread_id} vault='{vn}' (kept existing number)")
     else:
         logger.info(f"vault:link_thread user_id={user_id} char_key='{char_key}' thread_id={thread_id} vault='{vn}' (generated number)")
 
 def unlink_vault_thread(user_id: int, char_key: str) -> bool:
-    data = _load()
-    u = data.get(_key(user_id), {})
-    if char_key in u:
-        removed = u.pop(char_key, None)
-        data[_key(user_id)] = u
-        _save_atomic(data)
+    with _lock:
+        data = _data_locked()
+        u = data.get(_key(user_id), {})
+        removed = u.pop(char_key, None) if char_key in u else None
+        if removed is not None:
+            data[_key(user_id)] = u
+            _commit_locked(data)
+    if removed is not None:
         logger.info(f"vault:unlink user_id={user_id} char_key='{char_key}' removed={removed}")
         return True
     if logger.isEnabledFor(logging.DEBUG):
@@ -158,7 +185,8 @@ async def post_receipt(
     vault_number = info["vault_number"]
 
     try:
-        channel = await guild.fetch_channel(thread_id)
+        # Active threads are in the guild cache; only archived ones need the REST call
+        channel = guild.get_channel_or_thread(thread_id) or await guild.fetch_channel(thread_id)
     except Exception as e:
         logger.exception(f"receipt:fetch_channel_failed thread_id={thread_id} user_id={user_id} char_key='{char_key}': {e}")
         return